@@ -1,73 +1,30 @@
 import { type NextRequest, NextResponse } from "next/server"
-import { spawn } from "child_process"
-import path from "path"
+import { requestPrediction } from "@/lib/ai/predictor-worker"
 
 export async function POST(request: NextRequest) {
   try {
     const { productId, daysAhead = 7, historicalData } = await request.json()
 
-    // Ejecutar script de Python para predicción
-    const scriptPath = path.join(process.cwd(), "scripts", "ai_demand_predictor.py")
-
-    return new Promise((resolve) => {
-      const python = spawn("python3", [scriptPath])
-      let output = ""
-      let error = ""
-
-      // Enviar datos al script de Python
-      python.stdin.write(
-        JSON.stringify({
-          product_id: productId,
-          days_ahead: daysAhead,
-          historical_sales: historicalData || [],
-        }),
-      )
-      python.stdin.end()
-
-      python.stdout.on("data", (data) => {
-        output += data.toString()
-      })
-
-      python.stderr.on("data", (data) => {
-        error += data.toString()
+    // Consultar al proceso de Python residente (sin arrancar un intérprete por request)
+    try {
+      const result = await requestPrediction({
+        method: "predict",
+        product_id: productId,
+        days_ahead: daysAhead,
+        historical_sales: historicalData || [],
       })
 
-      python.on("close", (code) => {
-        if (code !== 0) {
-          resolve(NextResponse.json({ error: "Prediction failed", details: error }, { status: 500 }))
-          return
-        }
-
-        try {
-          // Simular predicciones si Python no está disponible
-          const mockPredictions = Array.from({ length: daysAhead }, (_, i) => {
-            const date = new Date()
-            date.setDate(date.getDate() + i + 1)
-
-            return {
-              date: date.toISOString().split("T")[0],
-              predicted_quantity: Math.floor(Math.random() * 50) + 30,
-              confidence: 0.75 + Math.random() * 0.2,
-              factors: {
-                trend: 0.02,
-                seasonal: 1.1,
-                monthly: 1.0,
-              },
-            }
-          })
-
-          resolve(
-            NextResponse.json({
-              success: true,
-              predictions: mockPredictions,
-              product_id: productId,
-            }),
-          )
-        } catch (parseError) {
-          resolve(NextResponse.json({ error: "Failed to parse predictions" }, { status: 500 }))
-        }
+      return NextResponse.json({
+        success: true,
+        predictions: result.predictions,
+        product_id: productId,
       })
-    })
+    } catch (predictionError) {
+      return NextResponse.json(
+        { error: "Prediction failed", details: (predictionError as Error).message },
+        { status: 500 },
+      )
+    }
   } catch (error) {
     return NextResponse.json({ error: "Internal server error" }, { status: 500 })
   }
@@ -1,4 +1,8 @@
 import { type NextRequest, NextResponse } from "next/server"
+import { spawn } from "child_process"
+import { promises as fs } from "fs"
+import os from "os"
+import path from "path"
 
 interface ExecutionContext {
   trigger_type: string
@@ -6,148 +10,94 @@ interface ExecutionContext {
   timestamp: string
 }
 
+interface WorkerResult {
+  enqueued: number
+  batches: number
+  events: number
+  executions: number
+  failed_batches: number
+  rule_stats: Record<string, { execution_count: number; last_executed: string | null }>
+}
+
+const BASE_URL = process.env.NEXT_PUBLIC_BASE_URL || "http://localhost:3000"
+const QUEUE_PATH = path.join(process.cwd(), "tmp", "workflow_queue.db")
+
 export async function POST(request: NextRequest) {
   try {
     const context: ExecutionContext = await request.json()
 
     // Obtener reglas activas
-    const rulesResponse = await fetch(
-      `${process.env.NEXT_PUBLIC_BASE_URL || "http://localhost:3000"}/api/automation/rules`,
-    )
+    const rulesResponse = await fetch(`${BASE_URL}/api/automation/rules`)
     const { rules } = await rulesResponse.json()
 
-    const executedRules = []
-
-    // Evaluar cada regla
-    for (const rule of rules) {
-      if (!rule.enabled) continue
-
-      // Verificar si el trigger coincide
-      if (rule.trigger.type !== context.trigger_type) continue
-
-      // Evaluar condiciones
-      const conditionsMet = evaluateConditions(rule.trigger.conditions, context.data)
-      if (!conditionsMet) continue
-
-      // Ejecutar acciones
-      const actionResults = await executeActions(rule.actions, context.data)
+    // El evento pasa por la cola durable; el worker evalúa las reglas y ejecuta las acciones
+    const event = { ...context.data, event_type: context.trigger_type, timestamp: context.timestamp }
+    const result = await runQueueWorker(rules, event)
 
-      executedRules.push({
-        rule_id: rule.id,
-        rule_name: rule.name,
-        actions_executed: actionResults.length,
-        success: actionResults.every((result) => result.success),
-      })
-
-      // Actualizar contador de ejecuciones
-      await fetch(`${process.env.NEXT_PUBLIC_BASE_URL || "http://localhost:3000"}/api/automation/rules`, {
-        method: "PUT",
+    // Contadores de todas las reglas ejecutadas en una sola actualización
+    if (Object.keys(result.rule_stats).length > 0) {
+      await fetch(`${BASE_URL}/api/automation/rules`, {
+        method: "PATCH",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          id: rule.id,
-          execution_count: rule.execution_count + 1,
-          last_executed: new Date().toISOString(),
-        }),
+        body: JSON.stringify({ updates: result.rule_stats }),
       })
     }
 
     return NextResponse.json({
-      success: true,
-      executed_rules: executedRules,
-      total_executed: executedRules.length,
+      success: result.failed_batches === 0,
+      queued: result.enqueued,
+      executed_rules: Object.entries(result.rule_stats).map(([rule_id, stats]) => ({
+        rule_id,
+        executions: stats.execution_count,
+        last_executed: stats.last_executed,
+      })),
+      total_executed: result.executions,
     })
   } catch (error) {
     return NextResponse.json({ error: "Failed to execute automation" }, { status: 500 })
   }
 }
 
-function evaluateConditions(conditions: Record<string, any>, data: Record<string, any>): boolean {
-  for (const [key, expectedValue] of Object.entries(conditions)) {
-    const actualValue = getNestedValue(data, key)
-
-    if (key.includes("_min") && actualValue < expectedValue) return false
-    if (key.includes("_max") && actualValue > expectedValue) return false
-    if (key === "threshold" && actualValue >= expectedValue) return false
-    if (typeof expectedValue === "string" && actualValue !== expectedValue) return false
-    if (typeof expectedValue === "number" && actualValue !== expectedValue) return false
-  }
-
-  return true
-}
-
-function getNestedValue(obj: Record<string, any>, path: string): any {
-  return path.split(".").reduce((current, key) => current?.[key], obj)
-}
-
-async function executeActions(
-  actions: Array<any>,
-  contextData: Record<string, any>,
-): Promise<Array<{ success: boolean; action: string }>> {
-  const results = []
-
-  for (const action of actions) {
-    try {
-      let success = false
-
-      switch (action.type) {
-        case "send_notification":
-          await fetch("/api/notifications/send", {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({
-              ...action.parameters,
-              data: contextData,
-            }),
-          })
-          success = true
-          break
-
-        case "reorder_inventory":
-          // Simular creación de orden de compra
-          console.log("Creating purchase order:", action.parameters)
-          success = true
-          break
-
-        case "update_status":
-          // Simular actualización de estado
-          console.log("Updating status:", action.parameters)
-          success = true
-          break
-
-        case "send_whatsapp":
-          await fetch("/api/whatsapp/send", {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({
-              phone: replaceTemplateVariables(action.parameters.customer_phone, contextData),
-              message: replaceTemplateVariables(action.parameters.template, contextData),
-            }),
-          })
-          success = true
-          break
+/**
+ * Encola el evento y procesa la cola con scripts/workflow_engine.py (--enqueue - --worker --once).
+ * Las reglas van en un archivo temporal por request; el worker informa en su última línea
+ * los contadores que sumó, además de lo encolado.
+ */
+async function runQueueWorker(rules: Array<any>, event: Record<string, any>): Promise<WorkerResult> {
+  const rulesDir = await fs.mkdtemp(path.join(os.tmpdir(), "automation-rules-"))
+  const rulesPath = path.join(rulesDir, "rules.json")
+  await fs.writeFile(rulesPath, JSON.stringify(rules))
+  await fs.mkdir(path.dirname(QUEUE_PATH), { recursive: true })
 
-        case "create_task":
-          // Simular creación de tarea
-          console.log("Creating task:", action.parameters)
-          success = true
-          break
-
-        default:
-          console.log("Unknown action type:", action.type)
-      }
+  try {
+    const scriptPath = path.join(process.cwd(), "scripts", "workflow_engine.py")
+    const output = await new Promise<string>((resolve, reject) => {
+      const child = spawn("python3", [
+        scriptPath,
+        "--enqueue",
+        "-",
+        "--worker",
+        "--once",
+        "--queue",
+        QUEUE_PATH,
+        "--rules",
+        rulesPath,
+      ])
+      let stdout = ""
+      child.stdout.on("data", (data) => (stdout += data.toString()))
+      child.stderr.on("data", (data) => console.error(`Workflow worker stderr: ${data.toString()}`))
+      child.on("error", reject)
+      child.on("close", (code) =>
+        code === 0 ? resolve(stdout) : reject(new Error(`Workflow worker exited with code ${code}`)),
+      )
+      child.stdin.end(JSON.stringify(event) + "\n")
+    })
 
-      results.push({ success, action: action.type })
-    } catch (error) {
-      console.error(`Failed to execute action ${action.type}:`, error)
-      results.push({ success: false, action: action.type })
-    }
+    // La primera línea JSON es la confirmación del encolado y la última el resumen del worker
+    const lines = output.split("\n").filter((line) => line.startsWith("{"))
+    const { enqueued } = JSON.parse(lines[0])
+    return { ...JSON.parse(lines[lines.length - 1]), enqueued }
+  } finally {
+    await fs.rm(rulesDir, { recursive: true, force: true })
   }
-
-  return results
-}
-
-function replaceTemplateVariables(template: string, data: Record<string, any>): string {
-  return template.replace(/\{\{([^}]+)\}\}/g, (match, path) => {
-    return getNestedValue(data, path) || match
-  })
 }
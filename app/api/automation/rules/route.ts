@@ -125,6 +125,33 @@ export async function PUT(request: NextRequest) {
   }
 }
 
+// Contadores de ejecución en bloque (los exporta el worker de la cola de eventos):
+// { updates: { [ruleId]: { execution_count: ejecuciones nuevas, last_executed } } }
+export async function PATCH(request: NextRequest) {
+  try {
+    const { updates } = (await request.json()) as {
+      updates: Record<string, { execution_count: number; last_executed?: string | null }>
+    }
+
+    let updated = 0
+    automationRules = automationRules.map((rule) => {
+      const delta = updates?.[rule.id]
+      if (!delta) return rule
+      updated++
+      const lastExecuted = [rule.last_executed, delta.last_executed].filter(Boolean).sort().pop()
+      return {
+        ...rule,
+        execution_count: rule.execution_count + delta.execution_count,
+        ...(lastExecuted ? { last_executed: lastExecuted } : {}),
+      }
+    })
+
+    return NextResponse.json({ success: true, updated })
+  } catch (error) {
+    return NextResponse.json({ error: "Failed to update rule counters" }, { status: 500 })
+  }
+}
+
 export async function DELETE(request: NextRequest) {
   try {
     const { id } = await request.json()
@@ -1,77 +1,146 @@
 // File: lib/agno/agent.ts
 
-import { spawn } from 'child_process';
+import { spawn, type ChildProcessWithoutNullStreams } from 'child_process';
+import fs from 'fs';
 import path from 'path';
+import readline from 'readline';
+
+type PendingRequest = {
+  onChunk?: (text: string) => void;
+  resolve: (answer: string) => void;
+  reject: (reason: Error) => void;
+  timer: NodeJS.Timeout;
+};
+
+const REQUEST_TIMEOUT_MS = 60_000;
+
+let agentPool: ChildProcessWithoutNullStreams | null = null;
+let nextRequestId = 1;
+const pending = new Map<number, PendingRequest>();
+
+/**
+ * Devuelve el proceso supervisor del pool de agentes, creándolo si no existe.
+ * El supervisor mantiene workers de Python ya inicializados (agno, genai, storage) entre mensajes.
+ */
+const getAgentPool = (): ChildProcessWithoutNullStreams => {
+  if (agentPool) return agentPool;
+
+  const isWindows = process.platform === "win32";
+
+  // Ruta al ejecutable de Python dentro del entorno virtual
+  const pythonExecutable = isWindows
+    ? path.join(process.cwd(), 'scripts', 'agente_congelato', 'venv', 'Scripts', 'python.exe')
+    : path.join(process.cwd(), 'scripts', 'agente_congelato', 'venv', 'bin', 'python3');
+
+  // Ruta al script que queremos ejecutar
+  const scriptPath = path.join(process.cwd(), 'scripts', 'agente_congelato', 'playground_congelato.py');
+
+  // Verificamos si el ejecutable de Python existe antes de intentar usarlo
+  if (!fs.existsSync(pythonExecutable)) {
+    console.error(`Error: No se encontró el ejecutable de Python en: ${pythonExecutable}`);
+    throw new Error("El entorno virtual de Python no está configurado correctamente.");
+  }
+
+  console.log(`Iniciando pool del agente: ${pythonExecutable} ${scriptPath} --serve`);
+  const child = spawn(pythonExecutable, [scriptPath, '--serve']);
+
+  // Cada línea de stdout es una respuesta JSON con el id del mensaje
+  readline.createInterface({ input: child.stdout }).on('line', (line) => {
+    let response: any;
+    try {
+      response = JSON.parse(line);
+    } catch {
+      // A veces el script imprime logs extra, los ignoramos
+      return;
+    }
+
+    const request = pending.get(response.id);
+    if (!request) return;
+
+    // Partes de una respuesta en stream: la solicitud sigue abierta hasta el registro "final"
+    if (response.type === 'chunk') {
+      request.onChunk?.(response.text);
+      return;
+    }
+
+    pending.delete(response.id);
+    clearTimeout(request.timer);
+
+    if (response.error) {
+      console.error(`Error en el agente de Python: ${response.error}`);
+      request.reject(new Error("El script del agente de Python falló. Revisa la consola para más detalles."));
+    } else {
+      request.resolve(response.answer || "El agente no dio una respuesta válida.");
+    }
+  });
+
+  child.stderr.on('data', (data) => {
+    console.error(`Agente Python: ${data.toString()}`);
+  });
+
+  // Si el supervisor muere, fallan los mensajes en curso y el próximo mensaje lo vuelve a crear
+  const handleExit = (reason: string) => {
+    if (agentPool === child) agentPool = null;
+    for (const [id, request] of pending) {
+      clearTimeout(request.timer);
+      request.reject(new Error(reason));
+      pending.delete(id);
+    }
+  };
+  child.on('error', (error) => handleExit(error.message));
+  child.on('exit', (code) => handleExit(`El pool del agente terminó con código ${code}`));
+
+  agentPool = child;
+  return child;
+};
+
+const sendToAgentPool = (
+  userMessage: string,
+  sessionId: string,
+  onChunk?: (text: string) => void,
+): Promise<string> => {
+  return new Promise((resolve, reject) => {
+    const id = nextRequestId++;
+    const timer = setTimeout(() => {
+      pending.delete(id);
+      reject(new Error("El agente de Python no respondió a tiempo."));
+    }, REQUEST_TIMEOUT_MS);
+
+    pending.set(id, { onChunk, resolve, reject, timer });
+
+    try {
+      // Enviamos el mensaje como un string JSON en una sola línea, con su id.
+      const request = { id, message: userMessage, sessionId: sessionId, stream: Boolean(onChunk) };
+      getAgentPool().stdin.write(JSON.stringify(request) + '\n');
+    } catch (error) {
+      clearTimeout(timer);
+      pending.delete(id);
+      reject(error as Error);
+    }
+  });
+};
 
 /**
- * Ejecuta el script del agente de Python y obtiene una respuesta.
+ * Envía el mensaje al pool residente del agente de Python y obtiene una respuesta.
  * @param userMessage El mensaje del usuario de WhatsApp.
  * @param sessionId Un identificador único para la conversación (el número de WhatsApp).
  * @returns La respuesta de texto del agente.
  */
 export function getAgnoResponse(userMessage: string, sessionId: string): Promise<string> {
-  // Devolvemos una Promise porque ejecutar el script es un proceso asíncrono.
-  return new Promise((resolve, reject) => {
-    const isWindows = process.platform === "win32";
-    
-    // Ruta al ejecutable de Python dentro del entorno virtual
-    const pythonExecutable = isWindows 
-      ? path.join(process.cwd(), 'scripts', 'agente_congelato', 'venv', 'Scripts', 'python.exe')
-      : path.join(process.cwd(), 'scripts', 'agente_congelato', 'venv', 'bin', 'python3');
-
-    // Ruta al script que queremos ejecutar
-    const scriptPath = path.join(process.cwd(), 'scripts', 'agente_congelato', 'playground_congelato.py');
-    
-    console.log(`Ejecutando: ${pythonExecutable} ${scriptPath}`);
-
-    // Verificamos si el ejecutable de Python existe antes de intentar usarlo
-    const fs = require('fs');
-    if (!fs.existsSync(pythonExecutable)) {
-        console.error(`Error: No se encontró el ejecutable de Python en: ${pythonExecutable}`);
-        reject(new Error("El entorno virtual de Python no está configurado correctamente."));
-        return;
-    }
+  return sendToAgentPool(userMessage, sessionId);
+}
 
-    const pythonProcess = spawn(pythonExecutable, [scriptPath]);
-
-    let responseData = '';
-    let errorData = '';
-
-    // Enviamos los datos al script de Python como un string JSON en una sola línea.
-    const inputData = JSON.stringify({ message: userMessage, sessionId: sessionId });
-    pythonProcess.stdin.write(inputData);
-    pythonProcess.stdin.end();
-
-    // Escuchamos lo que el script de Python imprime (su salida estándar).
-    pythonProcess.stdout.on('data', (data) => {
-      responseData += data.toString();
-    });
-
-    // Escuchamos si hay algún error.
-    pythonProcess.stderr.on('data', (data) => {
-      errorData += data.toString();
-    });
-
-    // Cuando el proceso de Python termina, resolvemos la Promise.
-    pythonProcess.on('close', (code) => {
-      if (code !== 0) {
-        console.error(`Error en script de Python (código ${code}): ${errorData}`);
-        reject(new Error("El script del agente de Python falló. Revisa la consola para más detalles."));
-      } else {
-        try {
-          // A veces la respuesta puede tener logs extra, buscamos solo el JSON
-          const jsonMatch = responseData.match(/{.*}/s);
-          if (jsonMatch) {
-            const response = JSON.parse(jsonMatch[0]);
-            resolve(response.answer || "El agente no dio una respuesta válida.");
-          } else {
-            throw new Error("No se encontró un JSON en la respuesta.");
-          }
-        } catch (e) {
-          console.error("Error al parsear la respuesta de Python:", responseData);
-          reject(new Error("La respuesta del agente no es un JSON válido."));
-        }
-      }
-    });
-  });
-}
\ No newline at end of file
+/**
+ * Igual que getAgnoResponse, pero entrega el texto a medida que el modelo lo genera.
+ * @param userMessage El mensaje del usuario.
+ * @param sessionId Un identificador único para la conversación.
+ * @param onChunk Se llama con cada parte del texto apenas llega.
+ * @returns La respuesta completa, cuando el agente termina.
+ */
+export function streamAgnoResponse(
+  userMessage: string,
+  sessionId: string,
+  onChunk: (text: string) => void,
+): Promise<string> {
+  return sendToAgentPool(userMessage, sessionId, onChunk);
+}
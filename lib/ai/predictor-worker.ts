@@ -0,0 +1,92 @@
+// File: lib/ai/predictor-worker.ts
+
+import { spawn, type ChildProcessWithoutNullStreams } from "child_process"
+import path from "path"
+import readline from "readline"
+
+type PendingRequest = {
+  resolve: (value: any) => void
+  reject: (reason: Error) => void
+  timer: NodeJS.Timeout
+}
+
+const REQUEST_TIMEOUT_MS = 30_000
+
+let worker: ChildProcessWithoutNullStreams | null = null
+let nextRequestId = 1
+const pending = new Map<number, PendingRequest>()
+
+/**
+ * Devuelve el proceso de Python residente, creándolo si no existe.
+ * El proceso queda vivo entre requests para evitar el arranque del intérprete y de NumPy.
+ */
+const getWorker = (): ChildProcessWithoutNullStreams => {
+  if (worker) return worker
+
+  const scriptPath = path.join(process.cwd(), "scripts", "ai_demand_predictor.py")
+  const child = spawn("python3", [scriptPath, "--serve"])
+
+  // Cada línea de stdout es una respuesta JSON con el id de la solicitud
+  readline.createInterface({ input: child.stdout }).on("line", (line) => {
+    let response: any
+    try {
+      response = JSON.parse(line)
+    } catch {
+      console.error("Respuesta inválida del predictor:", line)
+      return
+    }
+
+    const request = pending.get(response.id)
+    if (!request) return
+    pending.delete(response.id)
+    clearTimeout(request.timer)
+
+    if (response.success) {
+      request.resolve(response)
+    } else {
+      request.reject(new Error(response.error || "Prediction failed"))
+    }
+  })
+
+  child.stderr.on("data", (data) => {
+    console.error(`Predictor stderr: ${data.toString()}`)
+  })
+
+  // Si el proceso muere, fallan las solicitudes en curso y el próximo request lo vuelve a crear
+  const handleExit = (reason: string) => {
+    if (worker === child) worker = null
+    for (const [id, request] of pending) {
+      clearTimeout(request.timer)
+      request.reject(new Error(reason))
+      pending.delete(id)
+    }
+  }
+  child.on("error", (error) => handleExit(error.message))
+  child.on("exit", (code) => handleExit(`Predictor exited with code ${code}`))
+
+  worker = child
+  return child
+}
+
+/**
+ * Envía una solicitud al predictor residente y espera la respuesta con el mismo id.
+ */
+export function requestPrediction(payload: Record<string, any>): Promise<any> {
+  return new Promise((resolve, reject) => {
+    const id = nextRequestId++
+    const timer = setTimeout(() => {
+      pending.delete(id)
+      reject(new Error("Prediction timed out"))
+    }, REQUEST_TIMEOUT_MS)
+
+    pending.set(id, { resolve, reject, timer })
+
+    try {
+      getWorker().stdin.write(JSON.stringify({ ...payload, id }) + "\n")
+    } catch (error) {
+      clearTimeout(timer)
+      pending.delete(id)
+      reject(error as Error)
+    }
+  })
+}
@@ -0,0 +1,10 @@
+-- Sub-recipes: a recipe ingredient can be another recipe (dough, sauce, ...)
+
+ALTER TABLE recipe_ingredients
+    ADD COLUMN sub_recipe_id INTEGER REFERENCES recipes(id);
+
+ALTER TABLE recipe_ingredients
+    ADD CONSTRAINT recipe_ingredients_source_check
+    CHECK ((raw_material_id IS NULL) <> (sub_recipe_id IS NULL));
+
+CREATE INDEX idx_recipe_ingredients_sub_recipe ON recipe_ingredients(sub_recipe_id);
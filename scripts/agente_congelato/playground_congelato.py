@@ -1,5 +1,9 @@
 # File: scripts/agente_congelato/playground_congelato.py
 # VERSIÓN CON LLAMADA DIRECTA A GOOGLE GENERATIVE AI
+#
+# Las dependencias pesadas (agno, google.generativeai, sqlalchemy) se importan recién cuando
+# una ruta las necesita: el supervisor del pool no carga ninguna, la ruta directa solo carga
+# genai y el storage de sesiones, y el Agent completo con su MemoryManager se arma a pedido.
 
 import os
 from dotenv import load_dotenv
@@ -7,23 +11,24 @@ load_dotenv() # Carga la GOOGLE_API_KEY del archivo .env
 
 import sys
 import json
-import google.generativeai as genai
+import time
+import zlib
+import signal
+import argparse
+import threading
+import atexit
+import queue
+import shutil
+import sqlite3
+import tempfile
+import subprocess
+from collections import OrderedDict, deque
 from textwrap import dedent
-from agno.agent import Agent
-from agno.models.google import Gemini
-from agno.memory.v2.db.sqlite import SqliteMemoryDb
-from agno.memory.v2.manager import MemoryManager
-from agno.memory.v2.memory import Memory
-from agno.storage.sqlite import SqliteStorage
 
 # --- TU CONFIGURACIÓN DEL AGENTE (ESTO NO CAMBIA) ---
-# (Todo tu código de configuración de memory y agente_congelato se mantiene igual)
-# ...
-memory_db = SqliteMemoryDb(table_name="clienti_congelato", db_file="tmp/congelato_memory.db")
-memory = Memory(
-    db=memory_db,
-    memory_manager=MemoryManager(
-        memory_capture_instructions="""
+MODELO_GEMINI = "gemini-1.5-flash-latest"
+
+INSTRUCCIONES_MEMORIA = """
         Recolecta información detallada sobre nuestros clientes:
         - Nombre completo del cliente y cómo prefiere que lo llamen
         - Dirección de entrega completa y habitual (calle, número, piso/depto, barrio)
@@ -35,30 +40,14 @@ memory = Memory(
         - Forma de pago preferida (efectivo, transferencia)
         - Comentarios especiales sobre entregas anteriores
         - Tono de comunicación preferido del cliente (formal/informal)
-        """,
-        model=Gemini(id="gemini-1.5-flash-latest"),
-    ),
-)
+        """
 
-agente_congelato = Agent(
-    name="Agente Congelato",
-    agent_id="congelato-pizza-agent",
-    model=Gemini(id="gemini-1.5-flash-latest"),
-    memory=memory,
-    enable_agentic_memory=True,
-    enable_user_memories=True,
-    storage=SqliteStorage(
-        table_name="conversazioni_congelato", 
-        db_file="tmp/congelato_sessions.db"
-    ),
-    add_history_to_messages=True,
-    num_history_responses=5,
-    add_datetime_to_instructions=True,
-    description=dedent("""
+DESCRIPCION = dedent("""
         Eres el encargado de tomar pedidos en CONGELATO, una pizzería familiar de San Pedro.
         Eres una persona real, natural y relajada que trabaja ahí hace tiempo.
-    """),
-    instructions=dedent("""
+    """)
+
+INSTRUCCIONES = dedent("""
         Sos el encargado de CONGELATO, una pizzería de San Pedro. Actuás como una persona real que trabaja ahí.
         
         ***REGLAS DE GRAMÁTICA Y ESTILO ARGENTINO (¡MUY IMPORTANTE!)***
@@ -210,57 +199,778 @@ agente_congelato = Agent(
         - Pensá como un humano: ¿Qué le preguntarías vos? ¿Cómo se lo dirías?
         - Priorizá la claridad y la eficiencia, pero siempre envuelta en un trato humano y adaptable.
         - Recordá: NO USAR "¡" NI "¿" AL INICIO DE NINGUNA FRASE. SOLO AL FINAL. ESTO ES ESENCIAL PARA EL TONO ARGENTINO.
-    """),
-    markdown=True,
-    show_tool_calls=True,
-    debug_mode=False,
+    """)
+
+_storage = None
+_agente = None
+
+def ruta_db(nombre):
+    """
+    Ruta de una base de sesiones/memoria. Con el modelo falso se usa un directorio temporal
+    (compartido con los workers por CONGELATO_DB_DIR), así las pruebas y benchmarks no
+    escriben turnos falsos en las bases reales; CONGELATO_DB_DIR también se puede fijar a mano.
+    """
+    directorio = os.getenv("CONGELATO_DB_DIR")
+    if not directorio and usar_modelo_falso():
+        directorio = tempfile.mkdtemp(prefix="congelato-fake-")
+        os.environ["CONGELATO_DB_DIR"] = directorio
+        atexit.register(shutil.rmtree, directorio, ignore_errors=True)
+    return os.path.join(directorio or "tmp", nombre)
+
+def obtener_storage():
+    """Storage de sesiones de agno; es lo único de agno que usa la ruta directa."""
+    global _storage
+    if _storage is None:
+        from agno.storage.sqlite import SqliteStorage
+        _storage = SqliteStorage(
+            table_name="conversazioni_congelato",
+            db_file=ruta_db("congelato_sessions.db")
+        )
+    return _storage
+
+def obtener_agente():
+    """Arma el Agent completo (memoria, MemoryManager y modelo) la primera vez que se pide."""
+    global _agente
+    if _agente is None:
+        from agno.agent import Agent
+        from agno.models.google import Gemini
+        from agno.memory.v2.db.sqlite import SqliteMemoryDb
+        from agno.memory.v2.manager import MemoryManager
+        from agno.memory.v2.memory import Memory
+
+        memory_db = SqliteMemoryDb(table_name="clienti_congelato", db_file=ruta_db("congelato_memory.db"))
+        memory = Memory(
+            db=memory_db,
+            memory_manager=MemoryManager(
+                memory_capture_instructions=INSTRUCCIONES_MEMORIA,
+                model=Gemini(id=MODELO_GEMINI),
+            ),
+        )
+
+        _agente = Agent(
+            name="Agente Congelato",
+            agent_id="congelato-pizza-agent",
+            model=Gemini(id=MODELO_GEMINI),
+            memory=memory,
+            enable_agentic_memory=True,
+            enable_user_memories=True,
+            storage=obtener_storage(),
+            add_history_to_messages=True,
+            num_history_responses=5,
+            add_datetime_to_instructions=True,
+            description=DESCRIPCION,
+            instructions=INSTRUCCIONES,
+            markdown=True,
+            show_tool_calls=True,
+            debug_mode=False,
+        )
+    return _agente
+
+def __getattr__(name):
+    # Compatibilidad: `playground_congelato.agente_congelato` sigue existiendo, pero se crea a pedido
+    if name == "agente_congelato":
+        return obtener_agente()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# --- SECCIÓN DE LLAMADA DIRECTA A LA API DE GOOGLE (VERSIÓN 6 - GUARDADO DIFERIDO) ---
+_modelo = None
+
+def usar_modelo_falso():
+    """Con CONGELATO_FAKE_MODEL=1 se usa un modelo local que transmite texto fijo (pruebas offline)."""
+    return os.getenv("CONGELATO_FAKE_MODEL") == "1"
+
+class _RespuestaFalsa:
+    def __init__(self, text):
+        self.text = text
+
+class _ChatFalso:
+    def __init__(self, history, texto, demora):
+        self.history = history
+        self.texto = texto
+        self.demora = demora
+
+    def _partes(self):
+        palabras = self.texto.split(" ")
+        for i, palabra in enumerate(palabras):
+            time.sleep(self.demora)
+            yield _RespuestaFalsa(palabra if i == len(palabras) - 1 else palabra + " ")
+
+    def send_message(self, message, stream=False):
+        if stream:
+            return self._partes()
+        time.sleep(self.demora * len(self.texto.split(" ")))
+        return _RespuestaFalsa(self.texto)
+
+class ModeloFalso:
+    """Imita a genai.GenerativeModel: start_chat/send_message, con y sin stream."""
+
+    def __init__(self, texto=None, demora=None):
+        self.texto = texto or "Hola! Todo bien por acá. Contame, qué pizza te gustaría pedir hoy?"
+        self.demora = demora if demora is not None else float(os.getenv("CONGELATO_FAKE_DELAY", "0.05"))
+
+    def start_chat(self, history=None):
+        return _ChatFalso(history or [], self.texto, self.demora)
+
+def configurar_genai():
+    """Configura el cliente de Google GenAI. Se llama una sola vez por proceso."""
+    if usar_modelo_falso():
+        return
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("La variable de entorno GOOGLE_API_KEY no está configurada.")
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+
+def obtener_modelo():
+    """Devuelve el modelo con el prompt del sistema, creado una única vez por proceso."""
+    global _modelo
+    if _modelo is None and usar_modelo_falso():
+        _modelo = ModeloFalso()
+    elif _modelo is None:
+        import google.generativeai as genai
+        system_prompt = f"{DESCRIPCION}\n\n{INSTRUCCIONES}"
+        _modelo = genai.GenerativeModel(
+            model_name=MODELO_GEMINI,
+            system_instruction=system_prompt
+        )
+    return _modelo
+
+VENTANA_HISTORIAL = 10
+
+class CacheHistorial:
+    """
+    LRU con TTL de las últimas ventanas de conversación, ya convertidas al formato de Gemini.
+    Cada sesión guarda un ring buffer acotado; los turnos nuevos se agregan al guardarse
+    (write-through), así un chat activo en un worker residente no vuelve a leer SQLite.
+    """
+
+    def __init__(self, max_sesiones=500, ttl=1800.0, ventana=VENTANA_HISTORIAL):
+        self.max_sesiones = max_sesiones
+        self.ttl = ttl
+        self.ventana = ventana
+        self.sesiones = OrderedDict()  # session_id -> [expira, deque de mensajes]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def obtener(self, session_id):
+        """Devuelve una copia de la ventana cacheada, o None si no está o expiró."""
+        entrada = self.sesiones.get(session_id)
+        if entrada is None or entrada[0] < time.monotonic():
+            if entrada is not None:
+                del self.sesiones[session_id]
+            self.misses += 1
+            return None
+
+        self.sesiones.move_to_end(session_id)
+        self.hits += 1
+        return list(entrada[1])
+
+    def guardar(self, session_id, mensajes):
+        """Guarda la ventana leída del storage y descarta las sesiones menos usadas."""
+        self.sesiones[session_id] = [time.monotonic() + self.ttl, deque(mensajes, maxlen=self.ventana)]
+        self.sesiones.move_to_end(session_id)
+        while len(self.sesiones) > self.max_sesiones:
+            self.sesiones.popitem(last=False)
+            self.evictions += 1
+
+    def agregar(self, session_id, role, text):
+        """Write-through de un turno nuevo en la ventana de la sesión (si está cacheada)."""
+        entrada = self.sesiones.get(session_id)
+        if entrada is None:
+            return
+        entrada[1].append({"role": role, "parts": [{"text": text}]})
+        entrada[0] = time.monotonic() + self.ttl
+        self.sesiones.move_to_end(session_id)
+
+    def estadisticas(self):
+        total = self.hits + self.misses
+        return {
+            "sessions": len(self.sesiones),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+cache_historial = CacheHistorial(
+    max_sesiones=int(os.getenv("CONGELATO_CACHE_SESSIONS", "500")),
+    ttl=float(os.getenv("CONGELATO_CACHE_TTL", "1800")),
 )
 
-# --- SECCIÓN DE LLAMADA DIRECTA A LA API DE GOOGLE (VERSIÓN 5 - SIN GUARDADO) ---
-if __name__ == "__main__":
+class PersistenciaDiferida:
+    """
+    Cola write-behind para los turnos de conversación (las memorias de clientes las guarda
+    el MemoryManager de agno en su propia tabla).
+    Un hilo escritor junta lo encolado y lo escribe en una sola transacción por lote
+    (por tiempo o por tamaño), con las bases en modo WAL. La respuesta al cliente nunca
+    espera al disco; al cerrar se vacía la cola.
+    """
+
+    def __init__(self, sesiones_db=None, intervalo=1.0, max_lote=200):
+        # Sin ruta explícita se resuelve al primer uso (ver ruta_db), cuando ya se sabe
+        # si corre con el modelo falso
+        self._sesiones_db = sesiones_db
+        self.intervalo = intervalo
+        self.max_lote = max_lote
+        self.cola = queue.Queue()
+        self.hilo = None
+        self.lock = threading.Lock()
+        self.lector = None
+        # Turnos encolados y todavía no escritos, por sesión (para leerlos sin esperar al disco)
+        self.pendientes = {}
+        self.lotes = 0
+        self.escritos = 0
+
+    @property
+    def sesiones_db(self):
+        if self._sesiones_db is None:
+            self._sesiones_db = ruta_db("congelato_sessions.db")
+        return self._sesiones_db
+
+    def _conectar(self, db_file):
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        conn = sqlite3.connect(db_file)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _iniciar(self):
+        with self.lock:
+            if self.hilo is None:
+                self.hilo = threading.Thread(target=self._ciclo, daemon=True)
+                self.hilo.start()
+                atexit.register(self.cerrar)
+
+    def guardar_turnos(self, session_id, user_message, answer):
+        """Encola el mensaje del cliente y la respuesta del agente."""
+        self._iniciar()
+        ahora = time.time()
+        turnos = [(session_id, "user", user_message, ahora), (session_id, "model", answer, ahora)]
+        with self.lock:
+            self.pendientes.setdefault(session_id, []).extend(turnos)
+        for turno in turnos:
+            self.cola.put(("turno", turno))
+
+    def leer_turnos(self, session_id, limite):
+        """
+        Últimos turnos de la sesión, en orden cronológico: los guardados más los que este
+        proceso encoló y el hilo escritor todavía no escribió (sin esperarlo).
+        """
+        # Primero los pendientes y después el disco: un turno que se escribe en el medio
+        # aparece en los dos y se descarta de los pendientes, pero nunca falta
+        with self.lock:
+            pendientes = list(self.pendientes.get(session_id, ()))
+        rows = []
+        if self.lector is None and os.path.exists(self.sesiones_db):
+            self.lector = sqlite3.connect(self.sesiones_db, check_same_thread=False)
+        if self.lector is not None:
+            try:
+                rows = self.lector.execute(
+                    "SELECT role, content, created_at FROM turnos_congelato WHERE session_id = ? "
+                    "ORDER BY id DESC LIMIT ?",
+                    (session_id, limite),
+                ).fetchall()[::-1]
+            except sqlite3.OperationalError:
+                # La tabla todavía no existe (no se guardó ningún turno)
+                pass
+        guardados = set(rows)
+        rows.extend(
+            (role, content, creado) for _, role, content, creado in pendientes
+            if (role, content, creado) not in guardados
+        )
+        return [(role, content) for role, content, _ in rows[-limite:]]
+
+    def _ciclo(self):
+        sesiones = self._conectar(self.sesiones_db)
+        sesiones.execute(
+            "CREATE TABLE IF NOT EXISTS turnos_congelato ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, role TEXT NOT NULL, "
+            "content TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        sesiones.execute("CREATE INDEX IF NOT EXISTS idx_turnos_session ON turnos_congelato(session_id, id)")
+        sesiones.commit()
+
+        terminar = False
+        while not terminar:
+            lote = []
+            try:
+                lote.append(self.cola.get(timeout=self.intervalo))
+                while len(lote) < self.max_lote:
+                    lote.append(self.cola.get_nowait())
+            except queue.Empty:
+                pass
+
+            recibidos = len(lote)
+            if None in lote:
+                lote = [item for item in lote if item is not None]
+                terminar = True
+
+            try:
+                self._escribir(sesiones, lote)
+            except sqlite3.Error as e:
+                print(f"Error guardando {len(lote)} registros: {e}", file=sys.stderr)
+            finally:
+                for _ in range(recibidos):
+                    self.cola.task_done()
+
+        sesiones.close()
+
+    def _escribir(self, sesiones, lote):
+        turnos = [datos for tipo, datos in lote if tipo == "turno"]
+        if turnos:
+            try:
+                with sesiones:
+                    sesiones.executemany(
+                        "INSERT INTO turnos_congelato (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                        turnos,
+                    )
+            finally:
+                # Escritos o perdidos, dejan de estar pendientes (la lista no crece sin límite)
+                self._descartar_pendientes(turnos)
+        if lote:
+            self.lotes += 1
+            self.escritos += len(lote)
+
+    def _descartar_pendientes(self, turnos):
+        """Quita de pendientes los turnos ya escritos (los primeros de cada sesión)."""
+        por_sesion = {}
+        for turno in turnos:
+            por_sesion[turno[0]] = por_sesion.get(turno[0], 0) + 1
+        with self.lock:
+            for session_id, cantidad in por_sesion.items():
+                restantes = self.pendientes.get(session_id, [])[cantidad:]
+                if restantes:
+                    self.pendientes[session_id] = restantes
+                else:
+                    self.pendientes.pop(session_id, None)
+
+    def cerrar(self, timeout=10.0):
+        """Vacía la cola pendiente y detiene el hilo escritor."""
+        with self.lock:
+            hilo = self.hilo
+        if hilo is not None and hilo.is_alive():
+            self.cola.put(None)
+            hilo.join(timeout=timeout)
+
+persistencia = PersistenciaDiferida(intervalo=float(os.getenv("CONGELATO_FLUSH_INTERVAL", "1.0")))
+
+def construir_historial(session_id):
+    """Arma el historial de la conversación en el formato que espera Gemini (con cache)."""
+    gemini_history = cache_historial.obtener(session_id)
+    if gemini_history is not None:
+        return gemini_history
+
+    gemini_history = [
+        {"role": role, "parts": [{"text": content}]}
+        for role, content in persistencia.leer_turnos(session_id, VENTANA_HISTORIAL)
+    ]
+    # Sesiones anteriores a la cola de guardado: se leen del storage de agno
+    history = None if gemini_history or usar_modelo_falso() else obtener_storage().read(session_id=session_id)
+    if history:
+        for message in history[-VENTANA_HISTORIAL:]:
+            role = "user" if message.role == "user" else "model"
+            gemini_history.append({"role": role, "parts": [{"text": message.content}]})
+
+    cache_historial.guardar(session_id, gemini_history)
+    return list(gemini_history)
+
+def registrar_turno(session_id, user_message, answer):
+    """Actualiza la ventana cacheada y encola el guardado, sin bloquear la respuesta."""
+    cache_historial.agregar(session_id, "user", user_message)
+    cache_historial.agregar(session_id, "model", answer)
+    persistencia.guardar_turnos(session_id, user_message, answer)
+
+def responder(user_message, session_id):
+    """Genera la respuesta del agente para un mensaje de una sesión."""
+    chat = obtener_modelo().start_chat(history=construir_historial(session_id))
+    response = chat.send_message(user_message)
+    registrar_turno(session_id, user_message, response.text)
+    return response.text
+
+def responder_en_partes(user_message, session_id):
+    """Como responder(), pero entrega el texto a medida que Gemini lo genera."""
+    chat = obtener_modelo().start_chat(history=construir_historial(session_id))
+    partes = []
+    for chunk in chat.send_message(user_message, stream=True):
+        texto = chunk.text
+        if texto:
+            partes.append(texto)
+            yield texto
+    registrar_turno(session_id, user_message, "".join(partes))
+
+def emitir_en_partes(request_id, user_message, session_id, stream=None):
+    """Emite un registro "chunk" por cada parte y un registro "final" con la respuesta completa."""
+    partes = []
+    for texto in responder_en_partes(user_message, session_id):
+        partes.append(texto)
+        emitir({"id": request_id, "type": "chunk", "text": texto}, stream)
+    emitir({"id": request_id, "type": "final", "answer": "".join(partes)}, stream)
+
+# --- MODO WORKER RESIDENTE (JSON-LINES POR STDIN/STDOUT) ---
+def emitir(respuesta, stream=None):
+    """Escribe una respuesta JSON en una sola línea."""
+    stream = stream or sys.stdout
+    stream.write(json.dumps(respuesta) + "\n")
+    stream.flush()
+
+def ejecutar_worker():
+    """Atiende mensajes uno por uno hasta que se cierra stdin. Todo queda inicializado entre mensajes."""
+    configurar_genai()
+    obtener_modelo()
+    if not usar_modelo_falso():
+        obtener_storage()
+
     try:
-        # 1. Configurar el cliente de Google GenAI
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("La variable de entorno GOOGLE_API_KEY no está configurada.")
-        genai.configure(api_key=api_key)
-        
-        # 2. Leer los datos de entrada
-        input_data = sys.stdin.readline()
-        data = json.loads(input_data)
-        user_message = data.get("message")
-        session_id = data.get("sessionId")
-        
-        # 3. Construir el historial de la conversación
-        history = agente_congelato.storage.read(session_id=session_id)
-        gemini_history = []
-        if history:
-            for message in history[-10:]:
-                role = "user" if message.role == "user" else "model"
-                gemini_history.append({"role": role, "parts": [{"text": message.content}]})
-
-        # 4. Construir el prompt del sistema
-        system_prompt = f"{agente_congelato.description}\n\n{agente_congelato.instructions}"
-        
-        # 5. Inicializar el modelo y la sesión de chat
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash-latest",
-            system_instruction=system_prompt
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                emitir({"id": None, "error": f"JSON inválido: {e}"})
+                continue
+
+            request_id = request.get("id")
+            if request.get("type") == "ping":
+                emitir({
+                    "id": request_id,
+                    "type": "pong",
+                    "pid": os.getpid(),
+                    "cache": cache_historial.estadisticas(),
+                    "persisted": persistencia.escritos,
+                    "batches": persistencia.lotes,
+                })
+                continue
+
+            try:
+                if request.get("stream"):
+                    emitir_en_partes(request_id, request.get("message"), request.get("sessionId"))
+                else:
+                    emitir({"id": request_id, "answer": responder(request.get("message"), request.get("sessionId"))})
+            except Exception as e:
+                emitir({"id": request_id, "error": str(e)})
+    finally:
+        # Al cerrarse stdin se vacía la cola de guardado antes de salir
+        persistencia.cerrar()
+
+class _WorkerProceso:
+    """Un proceso worker del pool con su contador de mensajes y sus solicitudes pendientes."""
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
         )
-        chat = model.start_chat(history=gemini_history)
-        
-        # 6. Enviar el nuevo mensaje y obtener la respuesta
-        response = chat.send_message(user_message)
-        
-        # 7. Guardar la interacción en el storage de agno (TEMPORALMENTE DESACTIVADO)
-        # agente_congelato.storage.save(session_id=session_id, messages=[
-        #     {"role": "user", "content": user_message},
-        #     {"role": "assistant", "content": response.text}
-        # ])
-
-        # 8. Imprimir la respuesta para que Node.js la lea
-        print(json.dumps({ "answer": response.text }))
-
-    except Exception as e:
-        print(json.dumps({ "error": str(e) }), file=sys.stderr)
-        sys.exit(1)
\ No newline at end of file
+        self.started_at = time.monotonic()
+        self.requests = 0
+        self.pending = set()
+        self.ping_sent_at = None
+        self.cache_stats = None
+        self.retired = False
+        # Serializa las escrituras a stdin; nunca se toma junto con el lock del pool
+        self.write_lock = threading.Lock()
+
+    def enviar(self, request):
+        with self.write_lock:
+            self.process.stdin.write(json.dumps(request) + "\n")
+            self.process.stdin.flush()
+
+    def retirar(self):
+        """Cierra stdin: el worker termina los mensajes encolados y sale solo."""
+        with self.write_lock:
+            if not self.retired:
+                self.retired = True
+                try:
+                    self.process.stdin.close()
+                except OSError:
+                    pass
+
+class PoolCongelato:
+    """
+    Pool de workers pre-inicializados. Los mensajes de una misma sesión van siempre al mismo
+    worker (por hash del sessionId), así se respeta el orden de la conversación.
+    """
+
+    def __init__(self, workers=2, max_requests=200, health_interval=30.0, health_timeout=120.0):
+        self.max_requests = max_requests
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.lock = threading.Lock()
+        self.output_lock = threading.Lock()
+        self.closing = False
+        self.readers = []
+        self.slots = [self._iniciar_worker(slot) for slot in range(workers)]
+
+        self.health_thread = threading.Thread(target=self._verificar_salud, daemon=True)
+        self.health_thread.start()
+
+    def _iniciar_worker(self, slot):
+        worker = _WorkerProceso(slot)
+        self.readers = [reader for reader in self.readers if reader.is_alive()]
+        reader = threading.Thread(target=self._leer_worker, args=(worker,), daemon=True)
+        reader.start()
+        self.readers.append(reader)
+        return worker
+
+    def _emitir(self, respuesta):
+        with self.output_lock:
+            emitir(respuesta)
+
+    def enviar(self, request):
+        """Despacha un mensaje al worker de su sesión, reciclándolo si llegó al máximo."""
+        request_id = request.get("id")
+        if request.get("type") == "ping":
+            self._emitir({"id": request_id, "type": "pong", "workers": self.estado()})
+            return
+
+        slot = zlib.crc32(str(request.get("sessionId")).encode("utf-8")) % len(self.slots)
+        retirado = None
+        # Bajo el lock solo se elige el worker y se actualiza la contabilidad; la escritura va
+        # afuera, para que un pipe lleno no bloquee al lector que libera las solicitudes
+        with self.lock:
+            worker = self.slots[slot]
+            if worker.requests >= self.max_requests:
+                retirado = worker
+                worker = self.slots[slot] = self._iniciar_worker(slot)
+
+            worker.requests += 1
+            worker.pending.add(request_id)
+
+        if retirado is not None:
+            retirado.retirar()
+        try:
+            worker.enviar(request)
+        except (OSError, ValueError) as e:
+            with self.lock:
+                worker.pending.discard(request_id)
+            self._emitir({"id": request_id, "error": f"Worker no disponible: {e}"})
+
+    def estado(self):
+        """Resumen de los workers activos para el health check externo."""
+        with self.lock:
+            return [
+                {
+                    "pid": worker.process.pid,
+                    "requests": worker.requests,
+                    "pending": len(worker.pending),
+                    "cache": worker.cache_stats,
+                }
+                for worker in self.slots
+            ]
+
+    def _leer_worker(self, worker):
+        """Reenvía las respuestas de un worker y lo reemplaza si muere inesperadamente."""
+        for line in worker.process.stdout:
+            try:
+                response = json.loads(line)
+            except json.JSONDecodeError:
+                # Salida que no es del protocolo (logs de librerías): va a stderr
+                print(line.rstrip(), file=sys.stderr)
+                continue
+
+            if response.get("type") == "pong" and str(response.get("id", "")).startswith("__ping"):
+                worker.ping_sent_at = None
+                worker.cache_stats = response.get("cache")
+                continue
+
+            # Los "chunk" de un stream no cierran la solicitud: solo el registro final o un error
+            if response.get("type") != "chunk":
+                with self.lock:
+                    worker.pending.discard(response.get("id"))
+            self._emitir(response)
+
+        worker.process.wait()
+        with self.lock:
+            perdidos = list(worker.pending)
+            worker.pending.clear()
+        for request_id in perdidos:
+            self._emitir({"id": request_id, "error": "El worker del agente terminó inesperadamente."})
+
+        # Si el worker se cae apenas arranca (p. ej. falta una dependencia), se espera antes de reiniciar
+        if time.monotonic() - worker.started_at < 5.0:
+            time.sleep(1.0)
+
+        with self.lock:
+            if not self.closing and self.slots[worker.slot] is worker:
+                print(f"Worker {worker.process.pid} terminó (código {worker.process.returncode}), reiniciando...", file=sys.stderr)
+                self.slots[worker.slot] = self._iniciar_worker(worker.slot)
+
+    def _verificar_salud(self):
+        """Envía pings periódicos; un worker que no responde a tiempo se mata y se reinicia."""
+        while not self.closing:
+            time.sleep(self.health_interval)
+            a_pingear = []
+            with self.lock:
+                for worker in self.slots:
+                    if worker.ping_sent_at is not None:
+                        if time.monotonic() - worker.ping_sent_at > self.health_timeout:
+                            print(f"Worker {worker.process.pid} no responde, reiniciando...", file=sys.stderr)
+                            worker.process.kill()
+                        continue
+
+                    worker.ping_sent_at = time.monotonic()
+                    a_pingear.append(worker)
+
+            # Los pings se escriben fuera del lock del pool (ver enviar)
+            for worker in a_pingear:
+                try:
+                    worker.enviar({"id": f"__ping-{worker.process.pid}", "type": "ping"})
+                except (OSError, ValueError):
+                    worker.process.kill()
+
+    def cerrar(self, timeout=30.0):
+        """Cierre ordenado: no acepta más mensajes y espera a que los workers terminen lo pendiente."""
+        with self.lock:
+            self.closing = True
+            workers = list(self.slots)
+        for worker in workers:
+            worker.retirar()
+
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            try:
+                worker.process.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                worker.process.kill()
+        for reader in self.readers:
+            reader.join(timeout=1.0)
+
+def ejecutar_pool(workers, max_requests):
+    """Supervisor del pool: lee solicitudes JSON-lines de stdin y las reparte entre los workers."""
+    pool = PoolCongelato(workers=workers, max_requests=max_requests)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                pool.enviar(json.loads(line))
+            except json.JSONDecodeError as e:
+                pool._emitir({"id": None, "error": f"JSON inválido: {e}"})
+    finally:
+        pool.cerrar()
+
+# --- DIAGNÓSTICO DE ARRANQUE EN FRÍO ---
+PRESUPUESTO_ARRANQUE_MS = float(os.getenv("CONGELATO_STARTUP_BUDGET_MS", "1500"))
+
+def sondear_arranque():
+    """Carga lo mismo que un worker antes de su primer mensaje e informa cuánto tardó cada paso."""
+    inicio = time.perf_counter()
+    import google.generativeai  # noqa: F401
+    genai_ms = (time.perf_counter() - inicio) * 1000
+
+    inicio = time.perf_counter()
+    obtener_storage()
+    storage_ms = (time.perf_counter() - inicio) * 1000
+
+    print(json.dumps({"genai_ms": round(genai_ms, 1), "storage_ms": round(storage_ms, 1)}))
+
+def medir_arranque(importtime=False):
+    """Ejecuta el sondeo en un proceso nuevo y devuelve el tiempo total, las fases y el stderr."""
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += [os.path.abspath(__file__), "--startup-probe"]
+
+    inicio = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True)
+    total_ms = (time.perf_counter() - inicio) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"El sondeo de arranque falló: {result.stderr.strip()}")
+
+    fases = json.loads(result.stdout.strip().splitlines()[-1])
+    return total_ms, fases, result.stderr
+
+def reporte_arranque(top=15):
+    """Reporte al estilo `-X importtime`: módulos de primer nivel ordenados por tiempo acumulado."""
+    total_ms, fases, stderr = medir_arranque(importtime=True)
+
+    modulos = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        campos = line[len("import time:"):].split("|")
+        if len(campos) != 3:
+            continue
+        self_us, cumulative_us, package = campos
+        # Solo módulos de primer nivel (sin indentación): el acumulado incluye a sus hijos
+        if not package.startswith("  "):
+            modulos.append((int(cumulative_us), int(self_us), package.strip()))
+
+    modulos.sort(reverse=True)
+    print(f"Arranque en frío (con -X importtime): {total_ms:.0f} ms")
+    for fase, ms in fases.items():
+        print(f"  {fase}: {ms} ms")
+    print(f"\n{'acumulado [ms]':>15} {'propio [ms]':>12}  módulo")
+    for cumulative_us, self_us, package in modulos[:top]:
+        print(f"{cumulative_us / 1000:>15.1f} {self_us / 1000:>12.1f}  {package}")
+
+def verificar_presupuesto_arranque(presupuesto_ms=PRESUPUESTO_ARRANQUE_MS):
+    """Falla (código 1) si el arranque en frío de un worker supera el presupuesto configurado."""
+    total_ms, fases, _ = medir_arranque()
+    detalle = ", ".join(f"{fase}={ms} ms" for fase, ms in fases.items())
+    if total_ms > presupuesto_ms:
+        print(f"FALLA: arranque en frío de {total_ms:.0f} ms supera el presupuesto de {presupuesto_ms:.0f} ms ({detalle})")
+        return 1
+    print(f"OK: arranque en frío de {total_ms:.0f} ms dentro del presupuesto de {presupuesto_ms:.0f} ms ({detalle})")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agente Congelato")
+    parser.add_argument("--serve", action="store_true", help="Pool de workers residentes (JSON-lines por stdin/stdout)")
+    parser.add_argument("--worker", action="store_true", help="Worker individual del pool")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("CONGELATO_WORKERS", "2")))
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("CONGELATO_MAX_REQUESTS", "200")))
+    parser.add_argument("--startup-report", action="store_true", help="Reporte de tiempos de importación en frío")
+    parser.add_argument("--check-startup", action="store_true", help="Falla si el arranque en frío supera el presupuesto")
+    parser.add_argument("--startup-budget-ms", type=float, default=PRESUPUESTO_ARRANQUE_MS)
+    parser.add_argument("--startup-probe", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--stream", action="store_true", help="Emitir la respuesta en partes (JSON-lines)")
+    parser.add_argument("--fake-model", action="store_true", help="Modelo local con texto fijo, sin llamar a Gemini")
+    args = parser.parse_args()
+
+    if args.fake_model:
+        # Por variable de entorno para que también lo hereden los workers del pool
+        os.environ["CONGELATO_FAKE_MODEL"] = "1"
+    if usar_modelo_falso():
+        # El directorio temporal se crea acá, antes de lanzar workers, para que lo compartan
+        ruta_db("")
+
+    if args.startup_probe:
+        sondear_arranque()
+    elif args.startup_report:
+        reporte_arranque()
+    elif args.check_startup:
+        sys.exit(verificar_presupuesto_arranque(args.startup_budget_ms))
+    elif args.serve:
+        ejecutar_pool(args.workers, args.max_requests)
+    elif args.worker:
+        ejecutar_worker()
+    else:
+        try:
+            # 1. Configurar el cliente de Google GenAI
+            configurar_genai()
+
+            # 2. Leer los datos de entrada
+            input_data = sys.stdin.readline()
+            data = json.loads(input_data)
+
+            # 3. Generar la respuesta y 4. imprimirla para que Node.js la lea
+            if args.stream or data.get("stream"):
+                emitir_en_partes(data.get("id"), data.get("message"), data.get("sessionId"))
+            else:
+                answer = responder(data.get("message"), data.get("sessionId"))
+                print(json.dumps({ "answer": answer }))
+
+        except Exception as e:
+            print(json.dumps({ "error": str(e) }), file=sys.stderr)
+            sys.exit(1)
@@ -1,9 +1,534 @@
+import os
+import sys
 import json
+import signal
+import argparse
+import threading
+import socketserver
+import time
+import sqlite3
+import hashlib
+import heapq
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 import numpy as np
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 import math
 
+from cost_calculator import BillOfMaterials
+
+class ForecastState:
+    """Estadísticos suficientes de un producto: cada venta nueva actualiza el modelo en O(1)"""
+
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self.level = None       # Último valor suavizado
+        self.n = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_xy = 0.0
+        self.sum_x2 = 0.0
+        self.sum_quantity = 0.0  # Suma de cantidades sin suavizar (promedio con pocos datos)
+        self.base_day = None    # Ordinal de la primera venta
+        self.last_day = None    # Ordinal de la última venta
+
+    def update(self, date: str, quantity: float):
+        """Incorpora una venta (en orden cronológico) a los estadísticos"""
+        day = datetime.strptime(date, '%Y-%m-%d').toordinal()
+        if self.last_day is not None and day < self.last_day:
+            raise ValueError(f'Sales must be added in chronological order: {date}')
+
+        if self.level is None:
+            self.level = quantity
+            self.base_day = day
+        else:
+            self.level = self.alpha * quantity + (1 - self.alpha) * self.level
+        self.last_day = day
+
+        x = day - self.base_day
+        self.n += 1
+        self.sum_x += x
+        self.sum_y += self.level
+        self.sum_xy += x * self.level
+        self.sum_x2 += x * x
+        self.sum_quantity += quantity
+
+    def trend(self) -> Tuple[float, float]:
+        """Pendiente e intercepto de la regresión sobre los valores suavizados"""
+        if self.n == 0:
+            return 0, 0
+        denominator = self.n * self.sum_x2 - self.sum_x * self.sum_x
+        if denominator == 0:
+            # Un solo punto o todas las ventas el mismo día: sin pendiente
+            return 0, self.sum_y / self.n
+        slope = (self.n * self.sum_xy - self.sum_x * self.sum_y) / denominator
+        intercept = (self.sum_y - slope * self.sum_x) / self.n
+        return slope, intercept
+
+    def to_dict(self) -> Dict:
+        """Serializa el estado a un diccionario JSON"""
+        return {
+            'alpha': self.alpha,
+            'level': self.level,
+            'n': self.n,
+            'sum_x': self.sum_x,
+            'sum_y': self.sum_y,
+            'sum_xy': self.sum_xy,
+            'sum_x2': self.sum_x2,
+            'sum_quantity': self.sum_quantity,
+            'base_date': datetime.fromordinal(self.base_day).strftime('%Y-%m-%d') if self.base_day else None,
+            'last_date': datetime.fromordinal(self.last_day).strftime('%Y-%m-%d') if self.last_day else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ForecastState':
+        """Reconstruye un estado serializado con to_dict"""
+        state = cls(data.get('alpha', 0.3))
+        state.level = data.get('level')
+        state.n = data.get('n', 0)
+        state.sum_x = data.get('sum_x', 0.0)
+        state.sum_y = data.get('sum_y', 0.0)
+        state.sum_xy = data.get('sum_xy', 0.0)
+        state.sum_x2 = data.get('sum_x2', 0.0)
+        state.sum_quantity = data.get('sum_quantity', 0.0)
+        if data.get('base_date'):
+            state.base_day = datetime.strptime(data['base_date'], '%Y-%m-%d').toordinal()
+        if data.get('last_date'):
+            state.last_day = datetime.strptime(data['last_date'], '%Y-%m-%d').toordinal()
+        return state
+
+class SalesStore:
+    """
+    Historial de ventas en disco, columnar y de solo agregado: una fila por día (datetime64 a
+    partir de start_date) con una columna de ancho fijo por producto, para cantidades y para
+    cantidad de registros. Los archivos se leen con memmap, así que leer un rango de días no
+    copia datos; agregar un día solo extiende los archivos.
+    """
+
+    INDEX_FILE = 'index.json'
+    QUANTITIES_FILE = 'quantities.f8'
+    COUNTS_FILE = 'counts.i4'
+
+    def __init__(self, path: str, product_capacity: int = 256):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.start_date = None
+        self.n_days = 0
+        self.capacity = product_capacity
+        self.product_ids = []
+        self.watermark = None  # Hasta dónde se cargó desde la base (ver ingest_sales)
+        self.ingest_progress = None  # Avance de una carga en curso, para retomarla
+        self._index_mtime = None
+        # Callbacks con los productos de cada agregado (p. ej. ForecastCache.invalidate)
+        self.on_append = []
+        if not self.refresh():
+            self.product_index = {}
+            self._map()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def refresh(self) -> bool:
+        """
+        Releer el índice si otro proceso lo reescribió (p. ej. una carga con --ingest);
+        devuelve True si cambió
+        """
+        try:
+            mtime = os.stat(self._file(self.INDEX_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._index_mtime:
+            return False
+        with open(self._file(self.INDEX_FILE)) as f:
+            index = json.load(f)
+        self.start_date = np.datetime64(index['start_date'], 'D') if index['start_date'] else None
+        self.n_days = index['n_days']
+        self.capacity = index['capacity']
+        self.product_ids = index['product_ids']
+        self.watermark = index.get('watermark')
+        self.ingest_progress = index.get('ingest_progress')
+        self.product_index = {product_id: i for i, product_id in enumerate(self.product_ids)}
+        self._index_mtime = mtime
+        self._map()
+        return True
+
+    @property
+    def data_version(self) -> str:
+        """Identifica los datos cargados desde la base (watermark y cantidad de días)"""
+        return f'{self.watermark}/{self.n_days}'
+
+    def _map(self):
+        """(Re)abrir los memmaps con el tamaño actual; vacío si todavía no hay días"""
+        if self.n_days == 0:
+            self.quantities = np.zeros((0, self.capacity))
+            self.counts = np.zeros((0, self.capacity), dtype=np.int32)
+            return
+        shape = (self.n_days, self.capacity)
+        self.quantities = np.memmap(self._file(self.QUANTITIES_FILE), dtype=np.float64, mode='r+', shape=shape)
+        self.counts = np.memmap(self._file(self.COUNTS_FILE), dtype=np.int32, mode='r+', shape=shape)
+
+    def _write_index(self):
+        index = {
+            'start_date': str(self.start_date) if self.start_date is not None else None,
+            'n_days': self.n_days,
+            'capacity': self.capacity,
+            'product_ids': self.product_ids,
+            'watermark': self.watermark,
+            'ingest_progress': self.ingest_progress
+        }
+        tmp_path = self._file(self.INDEX_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._file(self.INDEX_FILE))
+        self._index_mtime = os.stat(self._file(self.INDEX_FILE)).st_mtime_ns
+
+    def _extend_days(self, n_days: int):
+        """Agregar días vacíos al final de los archivos"""
+        self.flush()
+        for name, itemsize in ((self.QUANTITIES_FILE, 8), (self.COUNTS_FILE, 4)):
+            with open(self._file(name), 'ab') as f:
+                f.truncate(n_days * self.capacity * itemsize)
+        self.n_days = n_days
+        self._map()
+
+    def _grow_products(self, needed: int):
+        """Más productos que columnas: se reescriben los archivos con el doble de ancho"""
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        old_quantities, old_counts = np.array(self.quantities), np.array(self.counts)
+        self.capacity = capacity
+        for name, old, dtype in ((self.QUANTITIES_FILE, old_quantities, np.float64), (self.COUNTS_FILE, old_counts, np.int32)):
+            grown = np.zeros((self.n_days, capacity), dtype=dtype)
+            grown[:, :old.shape[1]] = old
+            grown.tofile(self._file(name + '.tmp'))
+            os.replace(self._file(name + '.tmp'), self._file(name))
+        self._map()
+
+    def append_sales(self, sales: List[Dict]) -> int:
+        """
+        Agregar ventas ({'product_id', 'date', 'quantity'}) en orden cronológico. Pueden sumar
+        al último día guardado, pero no a días anteriores.
+        """
+        return self.append_arrays(
+            [sale.get('product_id') for sale in sales],
+            [sale['date'] for sale in sales],
+            np.fromiter((sale.get('quantity', 0) for sale in sales), dtype=np.float64, count=len(sales))
+        )
+
+    def append_arrays(self, product_ids: List, dates, quantities, counts=None, watermark: str = None,
+                      progress: Dict = None) -> int:
+        """
+        Agregar ventas en columnas (producto, día, cantidad y cantidad de registros; por defecto
+        uno por fila). El watermark y el avance de la carga (progress) se guardan junto con los
+        datos en la misma escritura del índice; pasar watermark sin progress cierra la carga.
+        """
+        self.refresh()
+        if len(product_ids) == 0:
+            if watermark is not None or progress is not None:
+                self._set_checkpoint(watermark, progress)
+                self._write_index()
+            return 0
+
+        days = np.asarray(dates, dtype='datetime64[D]')
+        if self.start_date is None:
+            self.start_date = days.min()
+        offsets = (days - self.start_date).astype(np.int64)
+        first_open_day = max(self.n_days - 1, 0)
+        if offsets.min() < first_open_day:
+            raise ValueError(f'Sales before {self.start_date + first_open_day} cannot be appended')
+
+        columns = np.fromiter(
+            (self.product_index.setdefault(product_id, len(self.product_index)) for product_id in product_ids),
+            dtype=np.int64, count=len(product_ids)
+        )
+        if len(self.product_index) > len(self.product_ids):
+            self.product_ids = list(self.product_index)
+        if len(self.product_ids) > self.capacity:
+            self._grow_products(len(self.product_ids))
+        if offsets.max() >= self.n_days:
+            self._extend_days(int(offsets.max()) + 1)
+
+        # Sumar solo sobre el bloque de días tocado
+        first = int(offsets.min())
+        flat_index = (offsets - first) * self.capacity + columns
+        size = (self.n_days - first) * self.capacity
+        quantities = np.asarray(quantities, dtype=np.float64)
+        counts = np.ones(len(flat_index)) if counts is None else np.asarray(counts, dtype=np.float64)
+        self.quantities[first:] += np.bincount(flat_index, weights=quantities, minlength=size).reshape(-1, self.capacity)
+        self.counts[first:] += np.bincount(flat_index, weights=counts, minlength=size).reshape(-1, self.capacity).astype(np.int32)
+
+        if watermark is not None or progress is not None:
+            self._set_checkpoint(watermark, progress)
+        self.flush()
+        self._write_index()
+
+        if self.on_append:
+            touched = [self.product_ids[column] for column in np.unique(columns)]
+            for callback in self.on_append:
+                callback(touched)
+        return len(flat_index)
+
+    def _set_checkpoint(self, watermark: Optional[str], progress: Optional[Dict]):
+        if watermark is not None:
+            self.watermark = watermark
+        self.ingest_progress = progress
+
+    def new_day_counts(self, product_ids: List, days) -> np.ndarray:
+        """
+        Conteos para filas ya agregadas por producto-día: 1, o 0 si el producto ya tiene ventas
+        en el último día guardado (el resto de un día que empezó en una carga anterior)
+        """
+        counts = np.ones(len(product_ids), dtype=np.int64)
+        if self.n_days == 0:
+            return counts
+        last_day = self.start_date + self.n_days - 1
+        for i in np.flatnonzero(np.asarray(days, dtype='datetime64[D]') == last_day):
+            column = self.product_index.get(product_ids[i])
+            if column is not None and self.counts[-1, column]:
+                counts[i] = 0
+        return counts
+
+    def append_day(self, date: str, quantities: Dict) -> int:
+        """Agregar el total de un día por producto"""
+        return self.append_sales([
+            {'product_id': product_id, 'date': date, 'quantity': quantity}
+            for product_id, quantity in quantities.items()
+        ])
+
+    def read(self, since: str = None, until: str = None) -> Tuple[List, np.datetime64, np.ndarray, np.ndarray]:
+        """
+        Matrices producto × día (vistas transpuestas del memmap, sin copia) para el rango
+        [since, until], en el mismo formato que DemandPredictor.build_sales_matrix
+        """
+        self.refresh()
+        if self.start_date is None:
+            return [], np.datetime64(datetime.now().date(), 'D'), np.zeros((0, 1)), np.zeros((0, 1), dtype=np.int32)
+
+        first, last = 0, self.n_days
+        if since is not None:
+            first = min(max(0, int((np.datetime64(since, 'D') - self.start_date).astype(np.int64))), self.n_days)
+        if until is not None:
+            last = min(self.n_days, int((np.datetime64(until, 'D') - self.start_date).astype(np.int64)) + 1)
+
+        n_products = len(self.product_ids)
+        if last <= first:
+            # Rango sin días: una columna vacía, igual que build_sales_matrix sin ventas
+            return (list(self.product_ids), self.start_date + first,
+                    np.zeros((n_products, 1)), np.zeros((n_products, 1), dtype=np.int32))
+        return (list(self.product_ids), self.start_date + first,
+                self.quantities[first:last, :n_products].T, self.counts[first:last, :n_products].T)
+
+    def flush(self):
+        for matrix in (self.quantities, self.counts):
+            if isinstance(matrix, np.memmap):
+                matrix.flush()
+
+DAILY_SALES_QUERY = """
+    SELECT oi.product_id, DATE(o.created_at) AS day, SUM(oi.quantity) AS quantity
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.id
+    WHERE o.created_at > {p} AND o.created_at <= {p} {status_filter}
+    GROUP BY oi.product_id, DATE(o.created_at)
+    ORDER BY day, oi.product_id
+"""
+
+def stream_daily_sales(conn, since: str, until: str, batch_size: int = 5000, placeholder: str = '%s',
+                       server_side: bool = True, exclude_statuses: Tuple[str, ...] = ('cancelled',)):
+    """
+    Lee de orders/order_items las cantidades diarias por producto con created_at en (since, until],
+    ya agregadas en la base (el rango usa idx_orders_date). Devuelve lotes de columnas
+    (product_ids, days, quantities) de a batch_size filas.
+
+    Con psycopg2 y server_side=True usa un cursor con nombre (del lado del servidor), así las
+    filas llegan por lotes sin materializar el resultado completo en el cliente.
+    """
+    status_filter = ''
+    params = [since, until]
+    if exclude_statuses:
+        status_filter = 'AND o.status NOT IN ({})'.format(', '.join([placeholder] * len(exclude_statuses)))
+        params.extend(exclude_statuses)
+    query = DAILY_SALES_QUERY.format(p=placeholder, status_filter=status_filter)
+
+    cursor = conn.cursor('daily_sales_ingest') if server_side else conn.cursor()
+    try:
+        if server_side:
+            cursor.itersize = batch_size
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            product_ids, days, quantities = zip(*rows)
+            yield (list(product_ids), np.array([str(day)[:10] for day in days], dtype='datetime64[D]'),
+                   np.array(quantities, dtype=np.float64))
+    finally:
+        cursor.close()
+
+def ingest_sales(conn, store: SalesStore, until: str = None, batch_size: int = 5000, placeholder: str = '%s',
+                 server_side: bool = True) -> Dict:
+    """
+    Carga incremental al SalesStore: trae solo los pedidos posteriores al watermark del almacén
+    (hasta `until`, por defecto el último created_at existente) y avanza el watermark.
+    Cada lote se agrega al leerlo, junto con el avance de la carga (filas ya cargadas de la
+    consulta ordenada); el watermark se mueve recién después del último lote. Si la carga se
+    corta, la siguiente retoma el mismo rango salteando esas filas, sin duplicar ventas.
+    Cada producto-día cuenta como un registro (igual que build_sales_matrix con totales
+    diarios): un día cortado por el watermark no vuelve a sumar al conteo.
+    """
+    since = store.watermark or '1970-01-01 00:00:00'
+    progress = store.ingest_progress
+    if progress and progress['since'] == since:
+        until, skip = progress['until'], progress['rows']
+    else:
+        skip = 0
+        if until is None:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f'SELECT MAX(created_at) FROM orders WHERE created_at > {placeholder}', [since])
+                latest = cursor.fetchone()[0]
+            finally:
+                cursor.close()
+            if latest is None:
+                return {'rows': 0, 'since': since, 'watermark': store.watermark}
+            until = str(latest)
+
+    consumed, rows = skip, 0
+    for product_ids, days, quantities in stream_daily_sales(conn, since, until, batch_size, placeholder, server_side):
+        consumed += len(product_ids)
+        if skip >= len(product_ids):
+            skip -= len(product_ids)
+            continue
+        product_ids, days, quantities = product_ids[skip:], days[skip:], quantities[skip:]
+        rows += store.append_arrays(product_ids, days, quantities, store.new_day_counts(product_ids, days),
+                                    progress={'since': since, 'until': until, 'rows': consumed})
+        skip = 0
+
+    store.append_arrays([], [], [], watermark=until)
+    return {'rows': rows, 'since': since, 'watermark': until}
+
+class ForecastCache:
+    """
+    Caché LRU de pronósticos por producto, con clave (product_id, horizonte, versión en
+    memoria del producto, parámetros: modelo y versión de los datos del almacén). La versión
+    de los datos cambia con cada carga desde la base, aunque la haga otro proceso; invalidate
+    es el atajo en proceso para los agregados que no la mueven, y descarta las entradas del
+    producto. Opcionalmente guarda una segunda capa en SQLite que sobrevive reinicios.
+    """
+
+    def __init__(self, max_entries: int = 1024, path: str = None):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # clave -> (producto, pronóstico)
+        self._keys_by_product = {}
+        self.versions = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.recomputed = 0
+        self.recompute_seconds = 0.0
+
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS forecasts (key TEXT PRIMARY KEY, product TEXT NOT NULL, value TEXT NOT NULL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_forecasts_product ON forecasts(product)')
+
+    def _key(self, product: str, days_ahead: int, params: str) -> str:
+        return f'{product}|{days_ahead}|{self.versions.get(product, 0)}|{params}'
+
+    def get_many(self, product_ids: List, days_ahead: int, params: str) -> Tuple[Dict, List]:
+        """Pronósticos en caché y lista de productos a recalcular"""
+        found, missing = {}, []
+        for product_id in product_ids:
+            product = json.dumps(product_id)
+            key = self._key(product, days_ahead, params)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                found[product_id] = entry[1]
+                continue
+
+            row = None
+            if self._conn is not None:
+                row = self._conn.execute('SELECT value FROM forecasts WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                value = json.loads(row[0])
+                self._remember(product, key, value)
+                self.disk_hits += 1
+                found[product_id] = value
+            else:
+                self.misses += 1
+                missing.append(product_id)
+        return found, missing
+
+    def put_many(self, forecasts: Dict, days_ahead: int, params: str, seconds: float = 0.0):
+        """Guardar pronósticos recién calculados (y el tiempo que llevó calcularlos)"""
+        self.recomputed += len(forecasts)
+        self.recompute_seconds += seconds
+        rows = []
+        for product_id, value in forecasts.items():
+            product = json.dumps(product_id)
+            key = self._key(product, days_ahead, params)
+            self._remember(product, key, value)
+            rows.append((key, product, json.dumps(value)))
+        if self._conn is not None and rows:
+            with self._conn:
+                self._conn.executemany('INSERT OR REPLACE INTO forecasts (key, product, value) VALUES (?, ?, ?)', rows)
+
+    def _remember(self, product: str, key: str, value: List[Dict]):
+        self._entries[key] = (product, value)
+        self._entries.move_to_end(key)
+        self._keys_by_product.setdefault(product, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            old_key, (old_product, _) = self._entries.popitem(last=False)
+            keys = self._keys_by_product.get(old_product)
+            if keys is not None:
+                keys.discard(old_key)
+                if not keys:
+                    del self._keys_by_product[old_product]
+            self.evictions += 1
+
+    def invalidate(self, product_ids: Iterable):
+        """Ventas nuevas: subir la versión de cada producto y descartar sus entradas"""
+        products = {json.dumps(product_id) for product_id in product_ids}
+        for product in products:
+            self.versions[product] = self.versions.get(product, 0) + 1
+            for key in self._keys_by_product.pop(product, ()):
+                self._entries.pop(key, None)
+        self.invalidations += len(products)
+
+        if self._conn is not None and products:
+            with self._conn:
+                self._conn.executemany('DELETE FROM forecasts WHERE product = ?', [(product,) for product in products])
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'recomputed': self.recomputed,
+            'recompute_seconds': round(self.recompute_seconds, 4),
+            'recompute_ms_per_product': round(self.recompute_seconds * 1000 / self.recomputed, 4) if self.recomputed else 0.0
+        }
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
 class DemandPredictor:
     def __init__(self):
         self.seasonal_factors = {
@@ -31,6 +556,16 @@ class DemandPredictor:
             12: 1.4   # Diciembre
         }
 
+        # Historial columnar en disco y caché de pronósticos (opcionales, ver SalesStore y ForecastCache)
+        self.sales_store = None
+        self.forecast_cache = None
+
+        # Tablas de factores indexadas para el cálculo vectorizado
+        self._weekday_names = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+        # Estado incremental por producto (ver ForecastState)
+        self.states: Dict[str, ForecastState] = {}
+
     def linear_regression(self, x_data: List[float], y_data: List[float]) -> Tuple[float, float]:
         """Implementa regresión lineal simple"""
         n = len(x_data)
@@ -154,31 +689,260 @@ class DemandPredictor:
         
         return predictions
 
-    def predict_inventory_needs(self, predictions: List[Dict], recipes: List[Dict]) -> Dict:
+    def build_sales_matrix(self, historical_sales: List[Dict]) -> Tuple[List, np.datetime64, np.ndarray, np.ndarray]:
+        """Agrupa las ventas en matrices producto × día de cantidades y cantidad de registros"""
+        product_index = {}
+        rows = np.fromiter(
+            (product_index.setdefault(sale.get('product_id'), len(product_index)) for sale in historical_sales),
+            dtype=np.intp, count=len(historical_sales)
+        )
+        product_ids = list(product_index)
+
+        if not historical_sales:
+            return product_ids, np.datetime64(datetime.now().date(), 'D'), np.zeros((0, 1)), np.zeros((0, 1), dtype=np.int64)
+
+        days = np.array([sale['date'] for sale in historical_sales], dtype='datetime64[D]')
+        quantities = np.fromiter((sale.get('quantity', 0) for sale in historical_sales), dtype=np.float64, count=len(historical_sales))
+
+        start_date = days.min()
+        columns = (days - start_date).astype(np.intp)
+        width = int(columns.max()) + 1
+        flat_index = rows * width + columns
+        size = len(product_ids) * width
+
+        # Una sola pasada agrupada con bincount en lugar de un filtro por producto
+        quantity_matrix = np.bincount(flat_index, weights=quantities, minlength=size).reshape(len(product_ids), width)
+        count_matrix = np.bincount(flat_index, minlength=size).reshape(len(product_ids), width)
+
+        return product_ids, start_date, quantity_matrix, count_matrix
+
+    def predict_from_store(self, store: 'SalesStore', days_ahead: int = 7, since: str = None,
+                           until: str = None, product_ids: List = None) -> Dict[str, List[Dict]]:
+        """
+        Predice los productos (todos por defecto) leyendo el historial directamente del almacén
+        en disco; con forecast_cache solo se recalculan los productos sin entrada vigente
+        """
+        known_ids, start_date, quantity_matrix, count_matrix = store.read(since, until)
+        requested = known_ids if product_ids is None else list(product_ids)
+
+        if self.forecast_cache is None:
+            predictions = self.predict_from_matrix(known_ids, start_date, quantity_matrix, count_matrix, days_ahead)
+            return {product_id: predictions.get(product_id, []) for product_id in requested}
+
+        params = f'{self._model_signature(since, until)}@{store.data_version}'
+        found, missing = self.forecast_cache.get_many(requested, days_ahead, params)
+        positions = {product_id: i for i, product_id in enumerate(known_ids)}
+        missing = [product_id for product_id in missing if product_id in positions]
+        if missing:
+            rows = [positions[product_id] for product_id in missing]
+            started = time.perf_counter()
+            computed = self.predict_from_matrix(missing, start_date, quantity_matrix[rows], count_matrix[rows], days_ahead)
+            self.forecast_cache.put_many(computed, days_ahead, params, time.perf_counter() - started)
+            found.update(computed)
+
+        return {product_id: found.get(product_id, []) for product_id in requested}
+
+    def _model_signature(self, since: str = None, until: str = None) -> str:
+        """Parámetros que cambian el pronóstico (incluye la fecha: sin historia suficiente se parte de hoy)"""
+        params = [self.seasonal_factors, sorted(self.monthly_factors.items()), since, until, str(datetime.now().date())]
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+    def predict_all_products(self, historical_sales: List[Dict], days_ahead: int = 7, product_ids: List = None) -> Dict[str, List[Dict]]:
+        """Predice demanda diaria para todos los productos en una sola pasada vectorizada"""
+        known_ids, start_date, quantity_matrix, count_matrix = self.build_sales_matrix(historical_sales)
+
+        if product_ids is not None:
+            # Productos sin ventas quedan como filas vacías (predicción promedio en cero)
+            positions = {product_id: i for i, product_id in enumerate(known_ids)}
+            selected = [positions.get(product_id, -1) for product_id in product_ids]
+            quantity_matrix = np.vstack([quantity_matrix, np.zeros((1, quantity_matrix.shape[1]))])[selected]
+            count_matrix = np.vstack([count_matrix, np.zeros((1, count_matrix.shape[1]), dtype=np.int64)])[selected]
+            known_ids = list(product_ids)
+
+        return self.predict_from_matrix(known_ids, start_date, quantity_matrix, count_matrix, days_ahead)
+
+    def predict_from_matrix(self, product_ids: List, start_date: np.datetime64, quantity_matrix: np.ndarray,
+                            count_matrix: np.ndarray, days_ahead: int = 7, alpha: float = 0.3) -> Dict[str, List[Dict]]:
+        """Calcula suavizado, tendencia y factores estacionales para una matriz producto × día"""
+        n_products, width = quantity_matrix.shape
+        observed = count_matrix > 0
+        sample_counts = count_matrix.sum(axis=1)
+        steps = np.arange(1, days_ahead + 1)
+
+        # Suavizado exponencial por columna (día), vectorizado sobre todos los productos
+        smoothed = np.zeros((n_products, width))
+        level = np.zeros(n_products)
+        seen = np.zeros(n_products, dtype=bool)
+        for day in range(width):
+            present = observed[:, day]
+            current = quantity_matrix[:, day]
+            updated = np.where(seen, alpha * current + (1 - alpha) * level, current)
+            level = np.where(present, updated, level)
+            seen |= present
+            smoothed[:, day] = level
+
+        # Regresión lineal sobre los días observados de cada producto
+        columns = np.arange(width)
+        has_data = observed.any(axis=1)
+        first_day = np.where(has_data, observed.argmax(axis=1), 0)
+        last_day = np.where(has_data, width - 1 - observed[:, ::-1].argmax(axis=1), 0)
+        x_data = np.where(observed, columns[None, :] - first_day[:, None], 0)
+        y_data = np.where(observed, smoothed, 0.0)
+
+        n = observed.sum(axis=1)
+        sum_x = x_data.sum(axis=1)
+        sum_y = y_data.sum(axis=1)
+        sum_xy = (x_data * y_data).sum(axis=1)
+        sum_x2 = (x_data * x_data).sum(axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            denominator = n * sum_x2 - sum_x * sum_x
+            slope = np.where(denominator != 0, (n * sum_xy - sum_x * sum_y) / denominator, 0.0)
+            intercept = np.where(n > 0, (sum_y - slope * sum_x) / np.maximum(n, 1), 0.0)
+
+        # Fechas futuras: a partir del último dato de cada producto
+        future_days = start_date + (last_day[:, None] + steps[None, :])
+        days_from_base = (last_day - first_day)[:, None] + steps[None, :]
+        trend_prediction = slope[:, None] * days_from_base + intercept[:, None]
+
+        # Con pocos datos se usa el promedio simple a partir de hoy
+        today = np.datetime64(datetime.now().date(), 'D')
+        fallback_days = today + steps
+        average = quantity_matrix.sum(axis=1) / np.maximum(sample_counts, 1)
+        short_history = sample_counts < 7
+        future_days = np.where(short_history[:, None], fallback_days[None, :], future_days)
+
+        seasonal_table = np.array([self.seasonal_factors.get(name, 1.0) for name in self._weekday_names])
+        monthly_table = np.array([self.monthly_factors.get(month, 1.0) for month in range(1, 13)])
+        weekday = (future_days.astype(np.int64) + 3) % 7  # 1970-01-01 fue jueves
+        month = future_days.astype('datetime64[M]').astype(np.int64) % 12
+        seasonal = seasonal_table[weekday]
+        monthly = monthly_table[month]
+
+        base = np.where(short_history[:, None], average[:, None], trend_prediction)
+        final_prediction = base * seasonal * monthly
+        confidence = np.minimum(0.95, 0.5 + sample_counts / 100)
+
+        # Armar los mismos diccionarios que predict_daily_demand
+        date_strings = np.datetime_as_string(future_days, unit='D').tolist()
+        final_prediction = final_prediction.tolist()
+        seasonal = seasonal.tolist()
+        monthly = monthly.tolist()
+        results = {}
+        for row, product_id in enumerate(product_ids):
+            predictions = []
+            if short_history[row]:
+                for i in range(days_ahead):
+                    predictions.append({
+                        'date': date_strings[row][i],
+                        'predicted_quantity': round(final_prediction[row][i], 2),
+                        'confidence': 0.6,
+                        'factors': {
+                            'seasonal': seasonal[row][i],
+                            'monthly': monthly[row][i]
+                        }
+                    })
+            else:
+                row_confidence = round(float(confidence[row]), 2)
+                trend = round(float(slope[row]), 4)
+                for i in range(days_ahead):
+                    predictions.append({
+                        'date': date_strings[row][i],
+                        'predicted_quantity': round(max(0, final_prediction[row][i]), 2),
+                        'confidence': row_confidence,
+                        'factors': {
+                            'trend': trend,
+                            'seasonal': seasonal[row][i],
+                            'monthly': monthly[row][i]
+                        }
+                    })
+            results[product_id] = predictions
+
+        return results
+
+    def fit_states(self, historical_sales: List[Dict]):
+        """Construye el estado incremental de cada producto a partir del historial completo"""
+        ordered = sorted(historical_sales, key=lambda sale: sale['date'])
+        for sale in ordered:
+            self.update_sales(sale.get('product_id'), sale['date'], sale.get('quantity', 0))
+
+    def update_sales(self, product_id: str, date: str, quantity: float):
+        """Agrega una venta nueva al estado del producto en tiempo constante"""
+        state = self.states.get(product_id)
+        if state is None:
+            state = self.states[product_id] = ForecastState()
+        state.update(date, quantity)
+
+    def forecast(self, product_id: str, days_ahead: int = 7) -> List[Dict]:
+        """Pronóstico desde el estado incremental; el costo depende solo del horizonte"""
+        state = self.states.get(product_id) or ForecastState()
+        predictions = []
+
+        if state.n < 7:
+            avg_daily = state.sum_quantity / max(state.n, 1)
+            for i in range(days_ahead):
+                future_date = datetime.now() + timedelta(days=i+1)
+                seasonal_factor = self.seasonal_factors.get(future_date.strftime('%A').lower(), 1.0)
+                monthly_factor = self.monthly_factors.get(future_date.month, 1.0)
+
+                predictions.append({
+                    'date': future_date.strftime('%Y-%m-%d'),
+                    'predicted_quantity': round(avg_daily * seasonal_factor * monthly_factor, 2),
+                    'confidence': 0.6,
+                    'factors': {
+                        'seasonal': seasonal_factor,
+                        'monthly': monthly_factor
+                    }
+                })
+            return predictions
+
+        slope, intercept = state.trend()
+        confidence = min(0.95, 0.5 + (state.n / 100))
+        last_date = datetime.fromordinal(state.last_day)
+
+        for i in range(days_ahead):
+            future_date = last_date + timedelta(days=i+1)
+            days_from_base = state.last_day - state.base_day + i + 1
+            seasonal_factor = self.seasonal_factors.get(future_date.strftime('%A').lower(), 1.0)
+            monthly_factor = self.monthly_factors.get(future_date.month, 1.0)
+
+            final_prediction = max(0, (slope * days_from_base + intercept) * seasonal_factor * monthly_factor)
+
+            predictions.append({
+                'date': future_date.strftime('%Y-%m-%d'),
+                'predicted_quantity': round(final_prediction, 2),
+                'confidence': round(confidence, 2),
+                'factors': {
+                    'trend': round(slope, 4),
+                    'seasonal': seasonal_factor,
+                    'monthly': monthly_factor
+                }
+            })
+
+        return predictions
+
+    def export_states(self) -> Dict[str, Dict]:
+        """Serializa el estado incremental de todos los productos"""
+        return {str(product_id): state.to_dict() for product_id, state in self.states.items()}
+
+    def load_states(self, data: Dict[str, Dict]):
+        """Carga estados serializados con export_states"""
+        self.states = {product_id: ForecastState.from_dict(state) for product_id, state in data.items()}
+
+    def save_states(self, path: str):
+        """Guarda el estado incremental en disco (escritura atómica)"""
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.export_states(), f)
+        os.replace(temp_path, path)
+
+    def predict_inventory_needs(self, predictions: List[Dict], recipes: List[Dict],
+                                bom: Optional[BillOfMaterials] = None) -> Dict:
         """Predice necesidades de inventario basado en predicciones de demanda"""
-        inventory_needs = {}
-        
-        for prediction in predictions:
-            product_id = prediction.get('product_id')
-            predicted_quantity = prediction.get('predicted_quantity', 0)
-            
-            # Buscar receta del producto
-            recipe = next((r for r in recipes if r['product_id'] == product_id), None)
-            if not recipe:
-                continue
-                
-            # Calcular ingredientes necesarios
-            for ingredient in recipe.get('ingredients', []):
-                ingredient_id = ingredient['material_id']
-                quantity_per_unit = ingredient['quantity']
-                total_needed = predicted_quantity * quantity_per_unit
-                
-                if ingredient_id in inventory_needs:
-                    inventory_needs[ingredient_id] += total_needed
-                else:
-                    inventory_needs[ingredient_id] = total_needed
-        
-        return inventory_needs
+        # La matriz de recetas se arma una vez; se puede pasar ya construida entre llamadas
+        if bom is None:
+            bom = BillOfMaterials.from_recipes(recipes, material_key='material_id')
+        return bom.requirements(predictions, quantity_key='predicted_quantity')
 
     def optimize_production_schedule(self, predictions: List[Dict], capacity: Dict) -> List[Dict]:
         """Optimiza horario de producción basado en predicciones"""
@@ -207,6 +971,408 @@ class DemandPredictor:
         
         return schedule
 
+    def schedule_production(self, predictions, capacity: Dict, products: Dict = None,
+                            safety_factor: float = 0.5) -> Dict:
+        """
+        Reparte la demanda pronosticada de todos los productos en la capacidad diaria compartida.
+
+        Cada demanda (producto, día) se puede producir entre su día y (vida útil - 1) días antes.
+        Se recorre el horizonte desde el último día hacia atrás, con un heap de demandas
+        pendientes ordenado por el día más temprano permitido (la que vence antes va primero),
+        luego por confianza: así se produce lo más tarde posible (más fresco) y, si un día se
+        llena, el resto se adelanta a días anteriores.
+
+        predictions: lista de {'product_id', 'date', 'predicted_quantity', 'confidence'} o el
+            dict product_id -> predicciones de predict_all_products / predict_from_store
+        capacity: {'daily_units': 100} o {'daily_minutes': ...} (con minutes_per_unit por
+            producto), y opcionalmente 'by_date': {fecha: capacidad} para días especiales
+        products: product_id -> {'shelf_life_days', 'minutes_per_unit', 'variant_id'}
+        safety_factor: stock de seguridad, escala con la incertidumbre (1 - confianza)
+        """
+        if isinstance(predictions, dict):
+            predictions = [
+                {**prediction, 'product_id': product_id}
+                for product_id, product_predictions in predictions.items()
+                for prediction in product_predictions
+            ]
+        products = products or {}
+        if not predictions:
+            return {'items': [], 'unmet': [], 'utilization': {}}
+
+        product_index = {}
+        rows = np.fromiter(
+            (product_index.setdefault(prediction.get('product_id'), len(product_index)) for prediction in predictions),
+            dtype=np.int64, count=len(predictions)
+        )
+        product_ids = list(product_index)
+        days = np.array([prediction['date'] for prediction in predictions], dtype='datetime64[D]')
+        start_date = days.min()
+        due = (days - start_date).astype(np.int64)
+        horizon = int(due.max()) + 1
+
+        # Demanda entera con stock de seguridad según la confianza
+        confidence = np.fromiter((prediction.get('confidence', 0.5) for prediction in predictions), dtype=np.float64, count=len(predictions))
+        quantity = np.fromiter((prediction.get('predicted_quantity', 0) for prediction in predictions), dtype=np.float64, count=len(predictions))
+        demand = np.ceil(np.maximum(quantity, 0) * (1 + safety_factor * (1 - confidence)) - 1e-9).astype(np.int64)
+
+        shelf_life = np.array([products.get(product_id, {}).get('shelf_life_days', 1) for product_id in product_ids], dtype=np.int64)
+        minutes = np.array([products.get(product_id, {}).get('minutes_per_unit', 0) or 0 for product_id in product_ids], dtype=np.float64)
+        earliest = np.maximum(due - np.maximum(shelf_life[rows], 1) + 1, 0)
+
+        # Capacidad por día, en unidades o en minutos de horno/línea
+        by_minutes = 'daily_minutes' in capacity
+        cost = minutes if by_minutes else np.ones(len(product_ids))
+        if by_minutes and (cost <= 0).any():
+            raise ValueError('minutes_per_unit is required for every product when scheduling by daily_minutes')
+        default_capacity = capacity['daily_minutes'] if by_minutes else capacity.get('daily_units', 100)
+        remaining_capacity = np.full(horizon, float(default_capacity))
+        for date, value in capacity.get('by_date', {}).items():
+            day = int((np.datetime64(date, 'D') - start_date).astype(np.int64))
+            if 0 <= day < horizon:
+                remaining_capacity[day] = value
+        total_capacity = remaining_capacity.copy()
+
+        needed = np.zeros((len(product_ids), horizon), dtype=np.int64)
+        np.add.at(needed, (rows, due), demand)
+        planned = np.zeros((len(product_ids), horizon), dtype=np.int64)
+        left = demand.copy()
+
+        by_due = np.argsort(-due, kind='stable')
+        next_job = 0
+        heap, unmet = [], []
+        for day in range(horizon - 1, -1, -1):
+            while next_job < len(by_due) and due[by_due[next_job]] == day:
+                job = int(by_due[next_job])
+                if left[job] > 0:
+                    heapq.heappush(heap, (-int(earliest[job]), -confidence[job], job))
+                next_job += 1
+
+            skipped = []
+            while heap:
+                neg_earliest, _, job = heap[0]
+                if -neg_earliest > day:
+                    # Ya no se puede producir a tiempo (vencería antes de su día de venta)
+                    heapq.heappop(heap)
+                    unmet.append(job)
+                    continue
+                product = rows[job]
+                fit = int(remaining_capacity[day] // cost[product] + 1e-9)
+                if fit <= 0:
+                    if remaining_capacity[day] < cost.min():
+                        break
+                    skipped.append(heapq.heappop(heap))
+                    continue
+                take = min(int(left[job]), fit)
+                planned[product, day] += take
+                left[job] -= take
+                remaining_capacity[day] -= take * cost[product]
+                if left[job] == 0:
+                    heapq.heappop(heap)
+            for entry in skipped:
+                heapq.heappush(heap, entry)
+        unmet.extend(job for _, _, job in heap)
+
+        # Filas con la forma de production_plan_items, por día de producción
+        product_confidence = np.zeros(len(product_ids))
+        np.maximum.at(product_confidence, rows, confidence)
+        dates = np.datetime_as_string(start_date + np.arange(horizon), unit='D').tolist()
+        items = []
+        for product, day in zip(*np.nonzero(needed + planned)):
+            product_id = product_ids[product]
+            quantity_planned = int(planned[product, day])
+            items.append({
+                'date': dates[day],
+                'product_id': product_id,
+                'variant_id': products.get(product_id, {}).get('variant_id'),
+                'quantity_needed': int(needed[product, day]),
+                'quantity_planned': quantity_planned,
+                'priority': 1 if product_confidence[product] > 0.8 else 2,
+                'estimated_time': int(round(quantity_planned * minutes[product])) if minutes[product] else None,
+                'status': 'scheduled',
+                'progress': 0
+            })
+        items.sort(key=lambda item: (item['date'], item['priority']))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            used = np.where(total_capacity > 0, 1 - remaining_capacity / total_capacity, 0.0)
+        return {
+            'items': items,
+            'unmet': [
+                {'product_id': product_ids[rows[job]], 'date': dates[due[job]], 'quantity': int(left[job])}
+                for job in sorted(unmet, key=lambda job: (due[job], rows[job])) if left[job] > 0
+            ],
+            'utilization': {dates[day]: round(float(used[day]), 4) for day in range(horizon)}
+        }
+
+# Matrices compartidas adjuntadas en cada proceso del pool: nombre -> (SharedMemory, ndarray)
+_shared_arrays = {}
+
+def _attach_shared(specs: List[Tuple[str, Tuple[int, ...], str]]) -> List[np.ndarray]:
+    """Vistas numpy sobre bloques de memoria compartida (cada bloque se adjunta una vez por proceso)"""
+    names = {name for name, _, _ in specs}
+    # Soltar los bloques de corridas anteriores
+    for old_name in [name for name in _shared_arrays if name not in names]:
+        _shared_arrays.pop(old_name)[0].close()
+
+    arrays = []
+    for name, shape, dtype in specs:
+        entry = _shared_arrays.get(name)
+        if entry is None:
+            block = shared_memory.SharedMemory(name=name)
+            entry = _shared_arrays[name] = (block, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+        arrays.append(entry[1])
+    return arrays
+
+def _forecast_chunk(task: Dict) -> Dict[str, List[Dict]]:
+    """Pronostica las filas [start, stop) de las matrices compartidas (corre en un proceso del pool)"""
+    predictor = DemandPredictor()
+    predictor.seasonal_factors = task['seasonal_factors']
+    predictor.monthly_factors = task['monthly_factors']
+    start, stop = task['rows']
+    quantity_matrix, count_matrix = (matrix[start:stop] for matrix in _attach_shared(task['matrices']))
+    return predictor.predict_from_matrix(task['product_ids'], np.datetime64(task['start_date'], 'D'),
+                                         quantity_matrix, count_matrix, task['days_ahead'], task['alpha'])
+
+class ParallelForecaster:
+    """
+    Pronóstico de todo el catálogo repartido en un pool de procesos. Las matrices producto × día
+    se copian una vez a memoria compartida; cada tarea recibe solo su rango de filas, y los
+    resultados se juntan en el orden de los productos.
+    """
+
+    def __init__(self, workers: int = None, chunk_size: int = None, predictor: DemandPredictor = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.predictor = predictor or DemandPredictor()
+        self._executor = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def forecast(self, product_ids: List, start_date: np.datetime64, quantity_matrix: np.ndarray,
+                 count_matrix: np.ndarray, days_ahead: int = 7, alpha: float = 0.3) -> Dict[str, List[Dict]]:
+        """Mismo resultado que DemandPredictor.predict_from_matrix, calculado por bloques en paralelo"""
+        n_products = len(product_ids)
+        if self.workers <= 1 or n_products == 0:
+            return self.predictor.predict_from_matrix(product_ids, start_date, quantity_matrix, count_matrix,
+                                                      days_ahead, alpha)
+
+        chunk_size = self.chunk_size or max(1, math.ceil(n_products / (self.workers * 4)))
+        blocks = []
+        try:
+            specs = []
+            for matrix in (np.ascontiguousarray(quantity_matrix), np.ascontiguousarray(count_matrix)):
+                block = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+                blocks.append(block)
+                np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=block.buf)[...] = matrix
+                specs.append((block.name, matrix.shape, matrix.dtype.str))
+
+            tasks = [{
+                'rows': (start, min(start + chunk_size, n_products)),
+                'product_ids': product_ids[start:start + chunk_size],
+                'matrices': specs,
+                'start_date': str(start_date),
+                'days_ahead': days_ahead,
+                'alpha': alpha,
+                'seasonal_factors': self.predictor.seasonal_factors,
+                'monthly_factors': self.predictor.monthly_factors
+            } for start in range(0, n_products, chunk_size)]
+
+            # map devuelve los bloques en el orden enviado: el resultado no depende de qué worker termina primero
+            results = {}
+            for chunk in self._pool().map(_forecast_chunk, tasks):
+                results.update(chunk)
+            return results
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    def forecast_sales(self, historical_sales: List[Dict], days_ahead: int = 7) -> Dict[str, List[Dict]]:
+        """Arma la matriz de ventas y pronostica todos los productos en paralelo"""
+        product_ids, start_date, quantity_matrix, count_matrix = self.predictor.build_sales_matrix(historical_sales)
+        return self.forecast(product_ids, start_date, quantity_matrix, count_matrix, days_ahead)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self) -> 'ParallelForecaster':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def benchmark_parallel(n_products: int = 2000, n_days: int = 365, worker_counts: List[int] = None,
+                       days_ahead: int = 7) -> List[Dict]:
+    """Benchmark: pronóstico del catálogo completo con 1..N procesos sobre datos sintéticos"""
+    rng = np.random.default_rng(7)
+    product_ids = [f'product_{i:05d}' for i in range(n_products)]
+    start_date = np.datetime64('2024-01-01', 'D')
+    count_matrix = (rng.random((n_products, n_days)) < 0.8).astype(np.int64)
+    quantity_matrix = rng.poisson(40, (n_products, n_days)) * count_matrix.astype(np.float64)
+
+    cpu_count = os.cpu_count() or 1
+    worker_counts = worker_counts or sorted({1, 2, max(1, cpu_count // 2), cpu_count})
+    baseline, expected, rows = None, None, []
+    for workers in worker_counts:
+        with ParallelForecaster(workers) as forecaster:
+            # Arranque del pool fuera de la medición
+            forecaster.forecast(product_ids[:workers], start_date, quantity_matrix[:workers],
+                                count_matrix[:workers], days_ahead)
+            started = time.perf_counter()
+            result = forecaster.forecast(product_ids, start_date, quantity_matrix, count_matrix, days_ahead)
+            elapsed = time.perf_counter() - started
+
+        if baseline is None:
+            baseline, expected = elapsed, result
+        rows.append({
+            'workers': workers,
+            'seconds': round(elapsed, 3),
+            'speedup': round(baseline / elapsed, 2),
+            'identical': result == expected and list(result) == product_ids
+        })
+    return rows
+
+def benchmark_schedule(n_products: int = 500, days: int = 30) -> Dict:
+    """Benchmark: programación de n_products × days predicciones con capacidad compartida"""
+    rng = np.random.default_rng(11)
+    dates = np.datetime_as_string(np.datetime64('2024-03-01', 'D') + np.arange(days), unit='D').tolist()
+    predictions = [
+        {'product_id': f'product_{i:04d}', 'date': date, 'predicted_quantity': float(rng.gamma(2, 10)),
+         'confidence': float(rng.uniform(0.5, 0.95))}
+        for i in range(n_products) for date in dates
+    ]
+    products = {f'product_{i:04d}': {'shelf_life_days': int(rng.integers(1, 5))} for i in range(n_products)}
+    daily_units = int(n_products * 20)  # Un poco menos que la demanda media con stock de seguridad
+
+    started = time.perf_counter()
+    plan = DemandPredictor().schedule_production(predictions, {'daily_units': daily_units}, products)
+    elapsed = time.perf_counter() - started
+    return {
+        'products': n_products,
+        'days': days,
+        'seconds': round(elapsed, 3),
+        'items': len(plan['items']),
+        'unmet_units': sum(row['quantity'] for row in plan['unmet']),
+        'max_utilization': max(plan['utilization'].values())
+    }
+
+def handle_request(predictor: DemandPredictor, request: Dict, state_path: str = None) -> Dict:
+    """Atiende una solicitud del protocolo JSON-lines y devuelve la respuesta con su id"""
+    request_id = request.get('id')
+    method = request.get('method', 'predict')
+
+    try:
+        if method == 'predict':
+            predictions = predictor.predict_daily_demand(
+                request.get('historical_sales', []),
+                request.get('product_id'),
+                request.get('days_ahead', 7)
+            )
+            result = {'product_id': request.get('product_id'), 'predictions': predictions}
+        elif method == 'predict_all':
+            predictions = predictor.predict_all_products(
+                request.get('historical_sales', []),
+                request.get('days_ahead', 7),
+                request.get('product_ids')
+            )
+            result = {'predictions': predictions}
+        elif method == 'update_sales':
+            for sale in request.get('sales', []):
+                predictor.update_sales(sale.get('product_id'), sale['date'], sale.get('quantity', 0))
+            if state_path:
+                predictor.save_states(state_path)
+            result = {'updated': len(request.get('sales', []))}
+        elif method == 'forecast':
+            predictions = predictor.forecast(request.get('product_id'), request.get('days_ahead', 7))
+            result = {'product_id': request.get('product_id'), 'predictions': predictions}
+        elif method == 'append_sales':
+            if predictor.sales_store is None:
+                raise ValueError('No sales store configured (--store)')
+            result = {'appended': predictor.sales_store.append_sales(request.get('sales', []))}
+        elif method == 'predict_stored':
+            if predictor.sales_store is None:
+                raise ValueError('No sales store configured (--store)')
+            predictions = predictor.predict_from_store(
+                predictor.sales_store,
+                request.get('days_ahead', 7),
+                request.get('since'),
+                request.get('until'),
+                request.get('product_ids')
+            )
+            result = {'predictions': predictions}
+        elif method == 'cache_stats':
+            if predictor.forecast_cache is None:
+                raise ValueError('Forecast cache is disabled')
+            result = {'cache': predictor.forecast_cache.stats()}
+        elif method == 'ping':
+            result = {'status': 'ok'}
+        else:
+            raise ValueError(f'Unknown method: {method}')
+    except Exception as e:
+        return {'id': request_id, 'success': False, 'error': str(e)}
+
+    return {'id': request_id, 'success': True, **result}
+
+def serve_stream(predictor: DemandPredictor, input_stream, output_stream, lock: threading.Lock = None,
+                 state_path: str = None):
+    """Procesa solicitudes JSON-lines (una por línea) hasta que se cierra la entrada"""
+    lock = lock or threading.Lock()
+
+    for line in input_stream:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            response = {'id': None, 'success': False, 'error': f'Invalid JSON: {e}'}
+        else:
+            with lock:
+                response = handle_request(predictor, request, state_path)
+
+        output_stream.write(json.dumps(response) + '\n')
+        output_stream.flush()
+
+def serve_socket(predictor: DemandPredictor, socket_path: str, state_path: str = None):
+    """Servidor JSON-lines sobre un socket Unix; cada conexión comparte el mismo predictor"""
+    lock = threading.Lock()
+
+    class PredictorHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            input_stream = (line.decode('utf-8') for line in self.rfile)
+            output_stream = _SocketWriter(self.wfile)
+            serve_stream(predictor, input_stream, output_stream, lock, state_path)
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    # SIGTERM cierra el servidor limpiamente y elimina el socket
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    with socketserver.ThreadingUnixStreamServer(socket_path, PredictorHandler) as server:
+        server.daemon_threads = True
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(socket_path)
+
+class _SocketWriter:
+    """Adaptador de texto sobre el stream binario del socket"""
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text: str):
+        self.wfile.write(text.encode('utf-8'))
+
+    def flush(self):
+        self.wfile.flush()
+
 def main():
     """Función principal para testing"""
     predictor = DemandPredictor()
@@ -232,4 +1398,58 @@ def main():
     return predictions
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Predicción de demanda')
+    parser.add_argument('--serve', action='store_true', help='Modo servidor JSON-lines por stdin/stdout')
+    parser.add_argument('--socket', help='Ruta de socket Unix para el modo servidor')
+    parser.add_argument('--state', help='Archivo JSON con el estado incremental de los productos')
+    parser.add_argument('--store', help='Directorio del historial de ventas columnar (SalesStore)')
+    parser.add_argument('--cache-size', type=int, default=1024, help='Pronósticos en la caché en memoria (0 la desactiva)')
+    parser.add_argument('--cache-path', help='Archivo SQLite para la capa en disco de la caché de pronósticos')
+    parser.add_argument('--ingest', action='store_true', help='Cargar ventas nuevas de la base (DATABASE_URL) al --store')
+    parser.add_argument('--sqlite', help='Base SQLite con el mismo esquema, en lugar de DATABASE_URL')
+    parser.add_argument('--benchmark-parallel', action='store_true', help='Medir el pronóstico en paralelo con 1..N procesos')
+    parser.add_argument('--workers', type=int, nargs='+', help='Cantidades de procesos a medir')
+    parser.add_argument('--benchmark-schedule', action='store_true', help='Medir la programación de producción con capacidad')
+    parser.add_argument('--products', type=int, help='Productos sintéticos de los benchmarks')
+    parser.add_argument('--days', type=int, help='Días sintéticos de los benchmarks')
+    args = parser.parse_args()
+
+    if args.ingest:
+        if not args.store:
+            parser.error('--ingest requires --store')
+        if args.sqlite:
+            conn, placeholder, server_side = sqlite3.connect(args.sqlite), '?', False
+        else:
+            import psycopg2
+            conn, placeholder, server_side = psycopg2.connect(os.environ['DATABASE_URL']), '%s', True
+        try:
+            print(json.dumps(ingest_sales(conn, SalesStore(args.store), placeholder=placeholder, server_side=server_side)))
+        finally:
+            conn.close()
+        sys.exit(0)
+
+    if args.benchmark_schedule:
+        print(json.dumps(benchmark_schedule(args.products or 500, args.days or 30)))
+        sys.exit(0)
+
+    if args.benchmark_parallel:
+        for row in benchmark_parallel(args.products or 2000, args.days or 365, args.workers):
+            print(json.dumps(row))
+        sys.exit(0)
+
+    predictor = DemandPredictor()
+    if args.store:
+        predictor.sales_store = SalesStore(args.store)
+        if args.cache_size > 0:
+            predictor.forecast_cache = ForecastCache(args.cache_size, args.cache_path)
+            predictor.sales_store.on_append.append(predictor.forecast_cache.invalidate)
+    if args.state and os.path.exists(args.state):
+        with open(args.state) as f:
+            predictor.load_states(json.load(f))
+
+    if args.socket:
+        serve_socket(predictor, args.socket, args.state)
+    elif args.serve:
+        serve_stream(predictor, sys.stdin, sys.stdout, state_path=args.state)
+    else:
+        main()
@@ -3,21 +3,600 @@ Bakery Cost Calculator
 Calculates recipe costs and profit margins
 """
 
-def calculate_recipe_cost(ingredients):
+import numpy as np
+
+
+class RecipeCycleError(ValueError):
+    """A recipe uses itself, directly or through its sub-recipes"""
+
+
+class UnitConversionError(ValueError):
+    """An ingredient unit can't be converted to the unit it is priced in"""
+
+
+class UnknownMaterialError(ValueError):
+    """A recipe uses a raw material that has no cost"""
+
+
+# unit -> (dimension, factor to the dimension's base unit: g, ml or unidad)
+UNIT_DEFINITIONS = {
+    'mg': ('mass', 0.001),
+    'g': ('mass', 1.0),
+    'kg': ('mass', 1000.0),
+    'oz': ('mass', 28.349523125),
+    'lb': ('mass', 453.59237),
+    'ml': ('volume', 1.0),
+    'cl': ('volume', 10.0),
+    'dl': ('volume', 100.0),
+    'l': ('volume', 1000.0),
+    'unidad': ('count', 1.0),
+    'docena': ('count', 12.0),
+}
+
+UNIT_ALIASES = {
+    'gr': 'g', 'grs': 'g', 'gramo': 'g', 'gramos': 'g',
+    'kilo': 'kg', 'kilos': 'kg', 'kgs': 'kg', 'kilogramo': 'kg', 'kilogramos': 'kg',
+    'cc': 'ml', 'mililitro': 'ml', 'mililitros': 'ml',
+    'lt': 'l', 'lts': 'l', 'litro': 'l', 'litros': 'l',
+    'u': 'unidad', 'un': 'unidad', 'unidades': 'unidad', 'unit': 'unidad', 'units': 'unidad',
+    'pza': 'unidad', 'pieza': 'unidad', 'piezas': 'unidad', 'docenas': 'docena',
+}
+
+
+class UnitRegistry:
+    """
+    Unit conversion factors, resolved once per (from unit, to unit) pair and cached.
+
+    Conversions are only allowed within a dimension (mass, volume, count); anything else
+    raises UnitConversionError, which recipe loading surfaces before any costing happens.
+    """
+
+    def __init__(self, definitions=None, aliases=None):
+        self.definitions = dict(UNIT_DEFINITIONS if definitions is None else definitions)
+        self.aliases = dict(UNIT_ALIASES if aliases is None else aliases)
+        self._factors = {}
+
+    def register(self, unit, dimension, factor, aliases=()):
+        """Add a unit (factor relative to the dimension's base unit)"""
+        self.definitions[unit.lower()] = (dimension, float(factor))
+        for alias in aliases:
+            self.aliases[alias.lower()] = unit.lower()
+        self._factors.clear()
+
+    def normalize(self, unit):
+        key = str(unit).strip().lower().rstrip('.')
+        return self.aliases.get(key, key)
+
+    def factor(self, from_unit, to_unit):
+        """
+        Multiplier converting a quantity in from_unit to to_unit
+
+        Missing units (None or empty) on either side are taken as already matching.
+        """
+        pair = (from_unit, to_unit)
+        factor = self._factors.get(pair)
+        if factor is None:
+            factor = self._factors[pair] = self._resolve(from_unit, to_unit)
+        return factor
+
+    def factors(self, pairs):
+        """
+        Conversion factors for a sequence of (from unit, to unit) pairs
+
+        Returns:
+            np.ndarray: One factor per pair
+        """
+        index = {}
+        codes = [index.setdefault(pair, len(index)) for pair in pairs]
+        table = np.array([self.factor(from_unit, to_unit) for from_unit, to_unit in index], dtype=float)
+        return table[np.asarray(codes, dtype=np.int64)] if codes else table
+
+    def compatible(self, from_unit, to_unit):
+        try:
+            self.factor(from_unit, to_unit)
+            return True
+        except UnitConversionError:
+            return False
+
+    def _resolve(self, from_unit, to_unit):
+        if not from_unit or not to_unit:
+            return 1.0
+        source, target = self.normalize(from_unit), self.normalize(to_unit)
+        if source == target:
+            return 1.0
+        if source not in self.definitions:
+            raise UnitConversionError(f"Unknown unit: {from_unit}")
+        if target not in self.definitions:
+            raise UnitConversionError(f"Unknown unit: {to_unit}")
+
+        source_dimension, source_factor = self.definitions[source]
+        target_dimension, target_factor = self.definitions[target]
+        if source_dimension != target_dimension:
+            raise UnitConversionError(f"Can't convert {from_unit} ({source_dimension}) to {to_unit} ({target_dimension})")
+        return source_factor / target_factor
+
+
+units = UnitRegistry()
+
+
+def group_recipe_rows(recipes, recipe_ingredients, raw_materials=None, registry=None):
+    """
+    Group `recipes` and `recipe_ingredients` rows by recipe id
+
+    When `raw_materials` is given, ingredient quantities are converted from the ingredient's
+    unit to the unit the material is priced in (and sub-recipe quantities to the sub-recipe's
+    yield_unit), so all later costing and BOM math works in a single unit per material.
+
+    Args:
+        recipes: Rows with 'id', 'product_id', 'yield_quantity' and optional 'yield_unit'
+        recipe_ingredients: Rows with 'recipe_id', 'quantity', optional 'unit' and
+            'raw_material_id' or 'sub_recipe_id'
+        raw_materials: Optional rows with 'id' and 'unit'
+        registry: UnitRegistry to use (default: the module registry)
+
+    Returns:
+        dict: recipe_id -> {'product_id', 'yield_quantity', 'ingredients': [...]}
+
+    Raises:
+        UnitConversionError: If an ingredient unit can't be converted to its material's unit
+    """
+    by_recipe = {}
+    yield_units = {}
+    for recipe in recipes:
+        by_recipe[recipe['id']] = {
+            'product_id': recipe.get('product_id'),
+            'yield_quantity': float(recipe.get('yield_quantity') or 1),
+            'ingredients': []
+        }
+        yield_units[recipe['id']] = recipe.get('yield_unit')
+
+    material_units = {row['id']: row.get('unit') for row in raw_materials or []}
+    converted, pairs, owners = [], [], []
+
+    for row in recipe_ingredients:
+        recipe = by_recipe.get(row['recipe_id'])
+        if recipe is None:
+            continue
+        ingredient = {
+            'raw_material_id': row.get('raw_material_id'),
+            'sub_recipe_id': row.get('sub_recipe_id'),
+            'quantity': float(row['quantity'])
+        }
+        recipe['ingredients'].append(ingredient)
+
+        if raw_materials is not None:
+            if ingredient['sub_recipe_id'] is not None:
+                target = yield_units.get(ingredient['sub_recipe_id'])
+            else:
+                target = material_units.get(ingredient['raw_material_id'])
+            converted.append(ingredient)
+            pairs.append((row.get('unit'), target))
+            owners.append(row['recipe_id'])
+
+    if pairs:
+        # Factors are resolved once per distinct unit pair, then applied in one multiply
+        registry = registry or units
+        try:
+            factors = registry.factors(pairs)
+        except UnitConversionError as e:
+            bad = next(i for i, pair in enumerate(pairs) if not registry.compatible(*pair))
+            raise UnitConversionError(f"Recipe {owners[bad]}: {e}") from None
+        quantities = np.array([ingredient['quantity'] for ingredient in converted]) * factors
+        for ingredient, quantity in zip(converted, quantities):
+            ingredient['quantity'] = float(quantity)
+
+    return by_recipe
+
+
+def recipe_build_order(recipes):
+    """
+    Order recipes so every sub-recipe comes before the recipes that use it
+
+    Args:
+        recipes: Dict mapping recipe_id to a recipe with 'ingredients'
+
+    Returns:
+        list: Recipe ids in dependency order
+
+    Raises:
+        RecipeCycleError: If the sub-recipe graph has a cycle (or references an unknown recipe)
+    """
+    order = []
+    state = {}  # recipe_id -> 1 while visiting, 2 when done
+
+    for root in recipes:
+        if state.get(root) == 2:
+            continue
+        # Iterative depth-first search; the stack holds (recipe_id, iterator over its sub-recipes)
+        stack = [(root, iter(_sub_recipes(recipes[root])))]
+        state[root] = 1
+        while stack:
+            recipe_id, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                state[recipe_id] = 2
+                order.append(recipe_id)
+            elif child not in recipes:
+                raise RecipeCycleError(f"Recipe {recipe_id} uses unknown sub-recipe {child}")
+            elif state.get(child) == 1:
+                path = [entry[0] for entry in stack]
+                cycle = path[path.index(child):] + [child]
+                raise RecipeCycleError("Recipe cycle: " + " -> ".join(str(r) for r in cycle))
+            elif state.get(child) is None:
+                state[child] = 1
+                stack.append((child, iter(_sub_recipes(recipes[child]))))
+
+    return order
+
+
+def _sub_recipes(recipe):
+    return [i['sub_recipe_id'] for i in recipe.get('ingredients', []) if i.get('sub_recipe_id') is not None]
+
+
+class RecipeCostEngine:
+    """
+    Multi-level recipe costing over the recipe/sub-recipe DAG.
+
+    Unit costs (total cost / yield) are memoized per recipe. A reverse-dependency index
+    (raw material -> recipes, sub-recipe -> parent recipes) limits recomputation after a
+    price change to the recipes that actually depend on it.
+    """
+
+    def __init__(self, material_costs, recipes):
+        """
+        Args:
+            material_costs: Dict mapping raw_material_id to cost_per_unit
+            recipes: Dict mapping recipe_id to {'product_id', 'yield_quantity', 'ingredients'}
+                where each ingredient has 'quantity' and 'raw_material_id' or 'sub_recipe_id'
+                (sub-recipe quantities are in units of the sub-recipe's yield)
+        """
+        self.material_costs = dict(material_costs)
+        self.recipes = recipes
+        self.order = recipe_build_order(recipes)
+        self.position = {recipe_id: i for i, recipe_id in enumerate(self.order)}
+
+        self.material_users = {}
+        self.recipe_users = {}
+        for recipe_id, recipe in recipes.items():
+            for ingredient in recipe['ingredients']:
+                if ingredient.get('sub_recipe_id') is not None:
+                    self.recipe_users.setdefault(ingredient['sub_recipe_id'], set()).add(recipe_id)
+                else:
+                    self.material_users.setdefault(ingredient['raw_material_id'], set()).add(recipe_id)
+
+        self.product_recipe = {}
+        for recipe_id, recipe in recipes.items():
+            if recipe.get('product_id') is not None:
+                self.product_recipe.setdefault(recipe['product_id'], recipe_id)
+
+        self.total_costs = {}
+        self.unit_costs = {}
+        for recipe_id in self.order:
+            self._compute(recipe_id)
+
+    @classmethod
+    def from_tables(cls, raw_materials, recipes, recipe_ingredients, registry=None):
+        """
+        Build the engine from `raw_materials`, `recipes` and `recipe_ingredients` rows
+
+        Ingredient quantities are converted to the unit each material is priced in;
+        incompatible units raise UnitConversionError here, before any costing.
+
+        Returns:
+            RecipeCostEngine
+        """
+        material_costs = {row['id']: float(row['cost_per_unit']) for row in raw_materials}
+        return cls(material_costs, group_recipe_rows(recipes, recipe_ingredients, raw_materials, registry))
+
+    def _compute(self, recipe_id):
+        recipe = self.recipes[recipe_id]
+        total = 0.0
+        for ingredient in recipe['ingredients']:
+            if ingredient.get('sub_recipe_id') is not None:
+                total += ingredient['quantity'] * self.unit_costs[ingredient['sub_recipe_id']]
+            else:
+                material_id = ingredient['raw_material_id']
+                if material_id not in self.material_costs:
+                    raise UnknownMaterialError(f"Recipe {recipe_id} uses raw material {material_id}, which has no cost")
+                total += ingredient['quantity'] * self.material_costs[material_id]
+        self.total_costs[recipe_id] = total
+        self.unit_costs[recipe_id] = total / recipe['yield_quantity']
+
+    def affected_recipes(self, material_ids):
+        """
+        Recipes that depend on any of the given raw materials, directly or through sub-recipes
+
+        Returns:
+            list: Recipe ids in dependency order
+        """
+        affected = set()
+        pending = [r for m in material_ids for r in self.material_users.get(m, ())]
+        while pending:
+            recipe_id = pending.pop()
+            if recipe_id not in affected:
+                affected.add(recipe_id)
+                pending.extend(self.recipe_users.get(recipe_id, ()))
+        return sorted(affected, key=self.position.__getitem__)
+
+    def update_material_costs(self, changes):
+        """
+        Apply new raw material prices and recompute only the affected recipes
+
+        Args:
+            changes: Dict mapping raw_material_id to the new cost_per_unit
+
+        Returns:
+            dict: Recomputed recipe_id -> total_cost
+        """
+        self.material_costs.update(changes)
+        updated = {}
+        for recipe_id in self.affected_recipes(changes):
+            self._compute(recipe_id)
+            updated[recipe_id] = self.total_costs[recipe_id]
+        return updated
+
+    def product_unit_cost(self, product_id, variant_cost_modifier=0):
+        """Unit cost of a product from its recipe (None if it has no recipe)"""
+        recipe_id = self.product_recipe.get(product_id)
+        if recipe_id is None:
+            return None
+        return self.unit_costs[recipe_id] + float(variant_cost_modifier or 0)
+
+    def write_costs(self, conn, recipe_ids=None, variants=None,
+                    open_statuses=('pending', 'confirmed'), placeholder='%s'):
+        """
+        Write recipes.total_cost and order_items.unit_cost/total_cost in bulk
+
+        Order items are only updated for orders still in one of `open_statuses`, so the
+        cost of orders already delivered stays as it was when they were made.
+
+        Args:
+            conn: DB-API connection (psycopg2, or any sqlite3 with placeholder='?')
+            recipe_ids: Recipes to write (default: all)
+            variants: `product_variants` rows with 'id', 'product_id' and 'cost_modifier'
+            open_statuses: Order statuses whose items get the new unit cost
+            placeholder: Parameter placeholder of the driver
+
+        Returns:
+            dict: Number of recipe and product rows sent
+        """
+        recipe_ids = list(self.order if recipe_ids is None else recipe_ids)
+        variants_by_product = {}
+        for variant in variants or []:
+            variants_by_product.setdefault(variant['product_id'], []).append(variant)
+        p = placeholder
+
+        recipe_rows = [(round(self.total_costs[r], 2), r) for r in recipe_ids]
+        # Base product (variant_id NULL) and variants go in separate statements: `IS NOT
+        # DISTINCT FROM` needs SQLite 3.39+, and Postgres only accepts `IS` for NULL
+        product_rows = []
+        variant_rows = []
+        for recipe_id in recipe_ids:
+            product_id = self.recipes[recipe_id].get('product_id')
+            if product_id is None or self.product_recipe.get(product_id) != recipe_id:
+                continue
+            unit_cost = self.unit_costs[recipe_id]
+            product_rows.append((round(unit_cost, 2), round(unit_cost, 2), product_id))
+            for variant in variants_by_product.get(product_id, []):
+                cost = round(unit_cost + float(variant.get('cost_modifier') or 0), 2)
+                variant_rows.append((cost, cost, product_id, variant['id']))
+
+        statuses = ", ".join([p] * len(open_statuses))
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(
+                f"UPDATE recipes SET total_cost = {p}, updated_at = CURRENT_TIMESTAMP WHERE id = {p}",
+                recipe_rows
+            )
+            open_orders = f"AND order_id IN (SELECT id FROM orders WHERE status IN ({statuses}))"
+            cursor.executemany(
+                f"UPDATE order_items SET unit_cost = {p}, total_cost = {p} * quantity "
+                f"WHERE product_id = {p} AND variant_id IS NULL {open_orders}",
+                [row + tuple(open_statuses) for row in product_rows]
+            )
+            cursor.executemany(
+                f"UPDATE order_items SET unit_cost = {p}, total_cost = {p} * quantity "
+                f"WHERE product_id = {p} AND variant_id = {p} {open_orders}",
+                [row + tuple(open_statuses) for row in variant_rows]
+            )
+            conn.commit()
+        finally:
+            cursor.close()
+
+        return {'recipes': len(recipe_rows), 'products': len(product_rows) + len(variant_rows)}
+
+
+class BillOfMaterials:
+    """
+    Sparse product -> raw material matrix built once from the recipes.
+
+    Entries are stored in coordinate form (product index, material index, quantity per unit),
+    so the requirements for a whole set of orders or forecasts are a single sparse
+    matrix-vector product instead of a walk over every recipe ingredient.
+    """
+
+    def __init__(self, product_ids, material_ids, rows, cols, quantities):
+        self.product_ids = list(product_ids)
+        self.material_ids = list(material_ids)
+        self.product_index = {product_id: i for i, product_id in enumerate(self.product_ids)}
+        # Entries sorted by product (unit_costs reduces each product as one segment)
+        order = np.argsort(np.asarray(rows, dtype=np.int64), kind='stable')
+        self.rows = np.asarray(rows, dtype=np.int64)[order]
+        self.cols = np.asarray(cols, dtype=np.int64)[order]
+        self.quantities = np.asarray(quantities, dtype=float)[order]
+
+    @classmethod
+    def from_recipes(cls, recipes, material_key='raw_material_id'):
+        """
+        Build the matrix from recipes with per-unit ingredient quantities
+
+        Args:
+            recipes: Dict mapping product_id to {'ingredients': [...]}, or a list of
+                recipes with 'product_id' (the first recipe of a product wins)
+            material_key: Ingredient field holding the raw material id
+
+        Returns:
+            BillOfMaterials
+        """
+        items = recipes.items() if isinstance(recipes, dict) else ((r['product_id'], r) for r in recipes)
+
+        product_ids, material_ids = [], []
+        product_index, material_index = {}, {}
+        rows, cols, quantities = [], [], []
+
+        for product_id, recipe in items:
+            if product_id in product_index:
+                continue
+            row = product_index[product_id] = len(product_ids)
+            product_ids.append(product_id)
+
+            for ingredient in recipe.get('ingredients', []):
+                material_id = ingredient[material_key]
+                col = material_index.get(material_id)
+                if col is None:
+                    col = material_index[material_id] = len(material_ids)
+                    material_ids.append(material_id)
+                rows.append(row)
+                cols.append(col)
+                quantities.append(ingredient['quantity'])
+
+        return cls(product_ids, material_ids, rows, cols, quantities)
+
+    @classmethod
+    def from_tables(cls, recipes, recipe_ingredients, raw_materials=None, registry=None):
+        """
+        Build the matrix from `recipes` and `recipe_ingredients` rows
+
+        Args:
+            recipes: Rows with 'id', 'product_id' and 'yield_quantity'
+            recipe_ingredients: Rows with 'recipe_id', 'quantity' and either 'raw_material_id'
+                or 'sub_recipe_id' (sub-recipes are expanded into their raw materials)
+            raw_materials: Optional rows with 'id' and 'unit'; when given, quantities are
+                converted to each material's unit
+            registry: UnitRegistry to use (default: the module registry)
+
+        Returns:
+            BillOfMaterials with quantities per unit produced (divided by the recipe yield)
+        """
+        by_recipe = group_recipe_rows(recipes, recipe_ingredients, raw_materials, registry)
+
+        # Raw materials per unit of each recipe, sub-recipes before the recipes that use them
+        per_unit = {}
+        for recipe_id in recipe_build_order(by_recipe):
+            recipe = by_recipe[recipe_id]
+            materials = {}
+            for ingredient in recipe['ingredients']:
+                quantity = ingredient['quantity'] / recipe['yield_quantity']
+                if ingredient.get('sub_recipe_id') is not None:
+                    for material_id, sub_quantity in per_unit[ingredient['sub_recipe_id']].items():
+                        materials[material_id] = materials.get(material_id, 0) + quantity * sub_quantity
+                else:
+                    material_id = ingredient['raw_material_id']
+                    materials[material_id] = materials.get(material_id, 0) + quantity
+            per_unit[recipe_id] = materials
+
+        return cls.from_recipes([
+            {
+                'product_id': recipe['product_id'],
+                'ingredients': [
+                    {'raw_material_id': material_id, 'quantity': quantity}
+                    for material_id, quantity in per_unit[recipe_id].items()
+                ]
+            }
+            for recipe_id, recipe in by_recipe.items() if recipe['product_id'] is not None
+        ])
+
+    def demand_vector(self, items, quantity_key='quantity'):
+        """
+        Aggregate orders or forecasts into a per-product quantity vector
+
+        Args:
+            items: Dicts with 'product_id' and a quantity field
+            quantity_key: Name of the quantity field
+
+        Returns:
+            tuple: (quantities per product, boolean mask of products present in items)
+        """
+        indices, quantities = [], []
+        for item in items:
+            index = self.product_index.get(item.get('product_id'))
+            if index is not None:
+                indices.append(index)
+                quantities.append(item.get(quantity_key, 0))
+
+        indices = np.asarray(indices, dtype=np.int64)
+        n_products = len(self.product_ids)
+        vector = np.bincount(indices, weights=np.asarray(quantities, dtype=float), minlength=n_products)
+        present = np.bincount(indices, minlength=n_products) > 0
+        return vector, present
+
+    def requirements_vector(self, vector):
+        """Raw material quantities for a per-product quantity vector (sparse matrix-vector product)"""
+        return np.bincount(self.cols, weights=self.quantities * vector[self.rows], minlength=len(self.material_ids))
+
+    def unit_costs(self, material_costs):
+        """
+        Raw material cost per unit of each product
+
+        Args:
+            material_costs: Costs aligned with material_ids, shape (materials,) or
+                (scenarios, materials) to price several scenarios at once
+
+        Returns:
+            np.ndarray: Shape (products,) or (scenarios, products)
+        """
+        material_costs = np.asarray(material_costs, dtype=float)
+        if material_costs.ndim == 1:
+            return np.bincount(self.rows, weights=self.quantities * material_costs[self.cols],
+                               minlength=len(self.product_ids))
+
+        costs = np.zeros((material_costs.shape[0], len(self.product_ids)))
+        if len(self.rows):
+            starts = np.flatnonzero(np.r_[True, self.rows[1:] != self.rows[:-1]])
+            contributions = material_costs[:, self.cols] * self.quantities
+            costs[:, self.rows[starts]] = np.add.reduceat(contributions, starts, axis=1)
+        return costs
+
+    def requirements(self, items, quantity_key='quantity'):
+        """
+        Raw material requirements for a set of orders or forecasts
+
+        Args:
+            items: Dicts with 'product_id' and a quantity field
+            quantity_key: Name of the quantity field
+
+        Returns:
+            dict: Needed quantity keyed by raw_material_id (only materials used by the items)
+        """
+        vector, present = self.demand_vector(items, quantity_key)
+        needed = self.requirements_vector(vector)
+        used = np.bincount(self.cols[present[self.rows]], minlength=len(self.material_ids)) > 0
+        return {self.material_ids[i]: float(needed[i]) for i in np.flatnonzero(used)}
+
+
+def calculate_recipe_cost(ingredients, registry=None):
     """
     Calculate total cost of a recipe based on ingredients
     
     Args:
-        ingredients: List of dicts with 'quantity', 'unit_cost', 'unit'
+        ingredients: List of dicts with 'quantity', 'unit_cost', 'unit' and optional
+            'cost_unit' (the unit unit_cost is priced in, e.g. 'kg' for 250 'g')
+        registry: UnitRegistry to use (default: the module registry)
     
     Returns:
         dict: Total cost and cost breakdown
     """
+    # Convert every quantity to the unit it is priced in (fails before any cost is computed)
+    factors = (registry or units).factors(
+        [(ingredient.get('unit'), ingredient.get('cost_unit')) for ingredient in ingredients]
+    )
+    
     total_cost = 0
     breakdown = []
     
-    for ingredient in ingredients:
-        ingredient_cost = ingredient['quantity'] * ingredient['unit_cost']
+    for ingredient, factor in zip(ingredients, factors.tolist()):
+        ingredient_cost = ingredient['quantity'] * factor * ingredient['unit_cost']
         total_cost += ingredient_cost
         
         breakdown.append({
@@ -68,35 +647,156 @@ def suggest_selling_price(cost_price, target_margin=40):
     suggested_price = cost_price / (1 - target_margin / 100)
     return round(suggested_price, 2)
 
-def calculate_batch_requirements(orders, recipes):
+def calculate_profit_margins(selling_prices, cost_prices):
+    """
+    Vectorized calculate_profit_margin over arrays of prices and costs
+
+    Args:
+        selling_prices: Array of selling prices (broadcast against cost_prices)
+        cost_prices: Array of costs
+
+    Returns:
+        dict: 'profit' and 'margin_percentage' arrays
+    """
+    selling_prices = np.asarray(selling_prices, dtype=float)
+    profit = selling_prices - np.asarray(cost_prices, dtype=float)
+    safe_prices = np.where(selling_prices > 0, selling_prices, 1)
+    margin_percentage = np.where(selling_prices > 0, profit / safe_prices * 100, 0)
+
+    return {
+        'profit': np.round(profit, 2),
+        'margin_percentage': np.round(margin_percentage, 2)
+    }
+
+def suggest_selling_prices(cost_prices, target_margins=40):
+    """
+    Vectorized suggest_selling_price
+
+    Args:
+        cost_prices: Array of costs
+        target_margins: Margin percentage, scalar or array broadcast against cost_prices
+
+    Returns:
+        np.ndarray: Suggested selling prices
+    """
+    target_margins = np.asarray(target_margins, dtype=float)
+    return np.round(np.asarray(cost_prices, dtype=float) / (1 - target_margins / 100), 2)
+
+class CatalogPricing:
+    """
+    What-if pricing over every product x variant of the catalog.
+
+    Each sellable item (a product, and each of its variants) is one column; scenarios are
+    rows of raw material prices. Costs, margins at current prices and the prices that hit
+    a target margin come out as (scenarios, items) arrays in one pass.
+    """
+
+    def __init__(self, bom, material_costs, products, variants=()):
+        """
+        Args:
+            bom: BillOfMaterials of the catalog
+            material_costs: Dict mapping raw_material_id to cost_per_unit
+            products: Rows with 'id', 'base_price' and optional 'cost_price' (used when the
+                product has no recipe)
+            variants: `product_variants` rows with 'id', 'product_id', 'price_modifier'
+                and 'cost_modifier'
+        """
+        self.bom = bom
+        self.material_ids = bom.material_ids
+        self.material_index = {material_id: i for i, material_id in enumerate(self.material_ids)}
+        self.base_material_costs = np.array([float(material_costs.get(m, 0)) for m in self.material_ids])
+
+        variants_by_product = {}
+        for variant in variants:
+            variants_by_product.setdefault(variant['product_id'], []).append(variant)
+
+        self.items = []  # (product_id, variant_id or None)
+        bom_index, fixed_cost, prices, cost_modifiers = [], [], [], []
+        for product in products:
+            product_id = product['id']
+            price = float(product.get('base_price', product.get('price')) or 0)
+            index = bom.product_index.get(product_id, -1)
+            options = [(None, 0, 0)] + [
+                (v['id'], float(v.get('price_modifier') or 0), float(v.get('cost_modifier') or 0))
+                for v in variants_by_product.get(product_id, [])
+            ]
+            for variant_id, price_modifier, cost_modifier in options:
+                self.items.append((product_id, variant_id))
+                bom_index.append(index)
+                fixed_cost.append(float(product.get('cost_price') or 0) if index < 0 else 0.0)
+                prices.append(price + price_modifier)
+                cost_modifiers.append(cost_modifier)
+
+        self.item_bom_index = np.array(bom_index, dtype=np.int64)
+        self.item_has_recipe = self.item_bom_index >= 0
+        self.item_fixed_cost = np.array(fixed_cost) + np.array(cost_modifiers)
+        self.item_prices = np.array(prices)
+
+    def scenario_costs(self, scenarios):
+        """
+        Raw material prices for each scenario
+
+        Args:
+            scenarios: List of dicts mapping raw_material_id to a price factor
+                (e.g. {'flour_001': 1.18} for flour +18%); {} is the current prices
+
+        Returns:
+            np.ndarray: Shape (scenarios, materials)
+        """
+        factors = np.ones((len(scenarios), len(self.material_ids)))
+        for row, changes in enumerate(scenarios):
+            for material_id, factor in changes.items():
+                column = self.material_index.get(material_id)
+                if column is not None:
+                    factors[row, column] = factor
+        return factors * self.base_material_costs
+
+    def evaluate(self, scenarios, target_margins=40, prices=None):
+        """
+        Costs, margins and target prices for every item under every scenario
+
+        Args:
+            scenarios: List of price-factor dicts, or a (scenarios, materials) cost array
+            target_margins: Margin percentage, scalar or array broadcast to (scenarios, items)
+            prices: Optional selling prices per item (default: current catalog prices)
+
+        Returns:
+            dict: 'items' plus (scenarios, items) arrays 'cost', 'profit',
+                'margin_percentage' and 'suggested_price'
+        """
+        if not isinstance(scenarios, np.ndarray):
+            scenarios = self.scenario_costs(scenarios)
+
+        recipe_costs = self.bom.unit_costs(scenarios)
+        costs = self.item_fixed_cost + np.where(
+            self.item_has_recipe, recipe_costs[:, np.maximum(self.item_bom_index, 0)], 0
+        )
+        prices = self.item_prices if prices is None else np.asarray(prices, dtype=float)
+        margins = calculate_profit_margins(prices, costs)
+
+        return {
+            'items': self.items,
+            'cost': np.round(costs, 4),
+            'profit': margins['profit'],
+            'margin_percentage': margins['margin_percentage'],
+            'suggested_price': suggest_selling_prices(costs, target_margins)
+        }
+
+def calculate_batch_requirements(orders, recipes, bom=None):
     """
     Calculate raw material requirements for a batch of orders
     
     Args:
         orders: List of order items with product_id and quantity
         recipes: Dict mapping product_id to recipe ingredients
+        bom: Optional prebuilt BillOfMaterials (reuse it across batches)
     
     Returns:
         dict: Total raw material requirements
     """
-    requirements = {}
-    
-    for order in orders:
-        product_id = order['product_id']
-        quantity = order['quantity']
-        
-        if product_id in recipes:
-            recipe = recipes[product_id]
-            for ingredient in recipe['ingredients']:
-                material_id = ingredient['raw_material_id']
-                needed_quantity = ingredient['quantity'] * quantity
-                
-                if material_id in requirements:
-                    requirements[material_id] += needed_quantity
-                else:
-                    requirements[material_id] = needed_quantity
-    
-    return requirements
+    if bom is None:
+        bom = BillOfMaterials.from_recipes(recipes)
+    return bom.requirements(orders)
 
 # Example usage
 if __name__ == "__main__":
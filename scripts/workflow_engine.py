@@ -1,24 +1,418 @@
+import io
+import os
+import re
+import sys
 import json
 import time
+import asyncio
+import argparse
+import signal
+import sqlite3
+import uuid
+import contextlib
+import operator
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Callable, Tuple, Iterable, Iterator
+
+TEMPLATE_VARIABLE = re.compile(r'\{\{([^}]+)\}\}')
+
+def compile_path(path: str) -> Callable[[Any], Any]:
+    """Accessor para una ruta con notación de punto (mismo resultado que _get_nested_value)"""
+    keys = tuple(path.split('.'))
+    if len(keys) == 1:
+        key = keys[0]
+        
+        def accessor(data):
+            return data.get(key) if isinstance(data, dict) else None
+        return accessor
+        
+    def nested_accessor(data):
+        current = data
+        for key in keys:
+            if isinstance(current, dict) and key in current:
+                current = current[key]
+            else:
+                return None
+        return current
+    return nested_accessor
+
+@functools.lru_cache(maxsize=1024)
+def compile_template(template: str) -> Tuple[Tuple[str, Optional[Callable]], ...]:
+    """
+    Parsear una plantilla en segmentos: (texto, None) para literales y (placeholder, accessor)
+    para cada {{ruta}}. Si la variable no existe se deja el placeholder tal cual.
+    """
+    parts = TEMPLATE_VARIABLE.split(template)
+    segments = []
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            if part:
+                segments.append((part, None))
+        else:
+            segments.append(('{{' + part + '}}', compile_path(part)))
+    return tuple(segments) or (('', None),)
+
+class ExecutionRecord:
+    """
+    Registro compacto de una ejecución. El evento y los resultados se guardan serializados al
+    registrarse: el historial no retiene (ni ve mutar) el dict vivo del evento
+    """
+    __slots__ = ('rule_id', 'timestamp', 'event_type', 'success', 'payload')
+    
+    def __init__(self, rule_id: str, timestamp: str, event_type: Optional[str], success: bool, payload: str):
+        self.rule_id = rule_id
+        self.timestamp = timestamp
+        self.event_type = event_type
+        self.success = success
+        self.payload = payload
+        
+    @classmethod
+    def create(cls, rule_id: str, timestamp: str, event_data: Dict[str, Any],
+               action_results: List[Dict[str, Any]]) -> 'ExecutionRecord':
+        payload = json.dumps({'event_data': event_data, 'action_results': action_results}, default=str)
+        return cls(
+            rule_id,
+            timestamp,
+            event_data.get('event_type'),
+            all(result.get('success', False) for result in action_results),
+            payload
+        )
+        
+    @classmethod
+    def from_row(cls, row: Tuple) -> 'ExecutionRecord':
+        rule_id, timestamp, event_type, success, payload = row
+        return cls(rule_id, timestamp, event_type, bool(success), payload)
+        
+    def to_row(self) -> Tuple:
+        return (self.rule_id, self.timestamp, self.event_type, int(self.success), self.payload)
+        
+    def to_dict(self) -> Dict[str, Any]:
+        payload = json.loads(self.payload)
+        return {
+            'rule_id': self.rule_id,
+            'event_data': payload['event_data'],
+            'action_results': payload['action_results'],
+            'timestamp': self.timestamp
+        }
+
+class ExecutionHistory:
+    """
+    Historial de ejecuciones acotado: un ring buffer de tamaño fijo en memoria. Los registros
+    más viejos se vuelcan (en lotes) a un log SQLite de solo inserción, consultable por regla
+    y rango de tiempo. Sin spill_path, los registros desalojados se descartan.
+    """
+    
+    def __init__(self, capacity: int = 1000, spill_path: Optional[str] = None, spill_batch: int = 256):
+        if capacity <= 0:
+            raise ValueError('History capacity must be positive')
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.spill_batch = spill_batch
+        self._buffer = [None] * capacity
+        self._start = 0
+        self._size = 0
+        self._pending_spill = []
+        self._conn = None
+        self.total_recorded = 0
+        self.total_spilled = 0
+        
+    def append(self, rule_id: str, event_data: Dict[str, Any], action_results: List[Dict[str, Any]], timestamp: str):
+        """Agregar una ejecución; si el buffer está lleno se desaloja la más vieja"""
+        record = ExecutionRecord.create(rule_id, timestamp, event_data, action_results)
+        
+        if self._size == self.capacity:
+            evicted = self._buffer[self._start]
+            self._buffer[self._start] = record
+            self._start = (self._start + 1) % self.capacity
+            if self.spill_path:
+                self._pending_spill.append(evicted)
+                if len(self._pending_spill) >= self.spill_batch:
+                    self.flush()
+        else:
+            self._buffer[(self._start + self._size) % self.capacity] = record
+            self._size += 1
+        self.total_recorded += 1
+        
+    def _records(self) -> Iterator[ExecutionRecord]:
+        for i in range(self._size):
+            yield self._buffer[(self._start + i) % self.capacity]
+            
+    def __len__(self) -> int:
+        return self._size
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return (record.to_dict() for record in self._records())
+    
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.spill_path)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS execution_log ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, rule_id TEXT NOT NULL, timestamp TEXT NOT NULL, '
+                'event_type TEXT, success INTEGER NOT NULL, payload TEXT NOT NULL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_execution_log_rule ON execution_log(rule_id, timestamp)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_execution_log_time ON execution_log(timestamp)')
+            self._conn.commit()
+        return self._conn
+    
+    def flush(self):
+        """Escribir en disco los registros desalojados pendientes (una transacción)"""
+        if not self._pending_spill:
+            return
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                'INSERT INTO execution_log (rule_id, timestamp, event_type, success, payload) VALUES (?, ?, ?, ?, ?)',
+                [record.to_row() for record in self._pending_spill]
+            )
+        self.total_spilled += len(self._pending_spill)
+        self._pending_spill = []
+        
+    def query(self, rule_id: Optional[str] = None, since: Optional[Any] = None, until: Optional[Any] = None) -> List[Dict[str, Any]]:
+        """Ejecuciones (disco + memoria) filtradas por regla y rango [since, until], en orden cronológico"""
+        since = since.isoformat() if isinstance(since, datetime) else since
+        until = until.isoformat() if isinstance(until, datetime) else until
+        
+        def matches(record):
+            return ((rule_id is None or record.rule_id == rule_id)
+                    and (since is None or record.timestamp >= since)
+                    and (until is None or record.timestamp <= until))
+        
+        results = []
+        if self.spill_path:
+            self.flush()
+            if self.total_spilled or os.path.exists(self.spill_path):
+                clauses, params = [], []
+                if rule_id is not None:
+                    clauses.append('rule_id = ?')
+                    params.append(rule_id)
+                if since is not None:
+                    clauses.append('timestamp >= ?')
+                    params.append(since)
+                if until is not None:
+                    clauses.append('timestamp <= ?')
+                    params.append(until)
+                where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+                rows = self._connection().execute(
+                    f'SELECT rule_id, timestamp, event_type, success, payload FROM execution_log{where} ORDER BY id', params
+                )
+                results.extend(ExecutionRecord.from_row(row).to_dict() for row in rows)
+                
+        results.extend(record.to_dict() for record in self._records() if matches(record))
+        return results
+    
+    def close(self):
+        """Volcar a disco lo pendiente y lo que sigue en el buffer (si hay spill_path) y cerrar el log"""
+        if self.spill_path and self._size:
+            self._pending_spill.extend(self._records())
+            self._buffer = [None] * self.capacity
+            self._start = 0
+            self._size = 0
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+class ExpiringKeys:
+    """
+    Conjunto de claves con vencimiento para cooldowns. Chequear y marcar son O(1); las claves
+    vencidas se purgan de a poco desde el frente de una cola por duración (cada cola está
+    ordenada por vencimiento porque todas sus claves tienen la misma duración).
+    """
+    
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._expires = {}
+        self._queues = {}  # duración -> deque de (vencimiento, clave)
+        
+    def add_if_absent(self, key: Any, ttl: float) -> bool:
+        """Marcar la clave por ttl segundos; False si ya estaba marcada y sin vencer"""
+        now = self.clock()
+        self._purge(now)
+        expires = self._expires.get(key)
+        if expires is not None and expires > now:
+            return False
+            
+        expires = now + ttl
+        self._expires[key] = expires
+        queue = self._queues.get(ttl)
+        if queue is None:
+            queue = self._queues[ttl] = deque()
+        queue.append((expires, key))
+        return True
+    
+    def _purge(self, now: float):
+        for queue in self._queues.values():
+            while queue and queue[0][0] <= now:
+                expires, key = queue.popleft()
+                if self._expires.get(key) == expires:
+                    del self._expires[key]
+    
+    def discard_prefix(self, prefix: Any):
+        """Olvidar las claves de una regla (claves de la forma (prefix, ...))"""
+        for key in [key for key in self._expires if key[0] == prefix]:
+            del self._expires[key]
+    
+    def __len__(self) -> int:
+        return len(self._expires)
 
 class WorkflowEngine:
-    def __init__(self):
+    def __init__(self, history_size: int = 1000, history_path: Optional[str] = None):
         self.rules = []
-        self.execution_history = []
+        self.execution_history = ExecutionHistory(history_size, history_path)
+        
+        # Índices de despacho: tipo de trigger -> reglas, y condiciones de igualdad -> reglas
+        self._rules_by_id = {}
+        self._compiled = {}
+        self._templates = {}
+        self._rule_order = {}
+        self._rules_by_type = {}
+        self._next_order = 0
+        
+        # Cooldowns: rule_id -> (segundos, accessors de la clave de dedup)
+        self._cooldowns = {}
+        self._recent_triggers = ExpiringKeys()
+        self.stats = {'executed': 0, 'suppressed': 0, 'suppressed_by_rule': {}}
         
     def add_rule(self, rule: Dict[str, Any]) -> str:
         """Agregar nueva regla de automatización"""
+        # Compilar antes de registrar: una condición inválida rechaza la regla
+        conditions = self.compile_conditions(rule.get('trigger', {}).get('conditions', {}))
+        cooldown = self.compile_cooldown(rule.get('cooldown'))
+        
         rule_id = f"rule_{int(time.time())}"
+        if rule_id in self._rules_by_id:
+            # Varias reglas agregadas en el mismo segundo
+            suffix = 1
+            while f"{rule_id}_{suffix}" in self._rules_by_id:
+                suffix += 1
+            rule_id = f"{rule_id}_{suffix}"
+            
         rule['id'] = rule_id
         rule['created_at'] = datetime.now().isoformat()
         rule['execution_count'] = 0
-        self.rules.append(rule)
+        self._register_rule(rule, conditions, cooldown)
+        return rule_id
+    
+    def load_rule(self, rule: Dict[str, Any]) -> str:
+        """Cargar una regla existente (p. ej. desde la base) conservando su id y contadores"""
+        rule_id = rule.get('id')
+        if rule_id is None:
+            raise ValueError('Loaded rules must have an id')
+        rule_id = str(rule_id)
+        if rule_id in self._rules_by_id:
+            raise ValueError(f'Duplicate rule id: {rule_id}')
+            
+        conditions = self.compile_conditions(rule.get('trigger', {}).get('conditions', {}))
+        cooldown = self.compile_cooldown(rule.get('cooldown'))
+        rule['id'] = rule_id
+        rule.setdefault('execution_count', 0)
+        self._register_rule(rule, conditions, cooldown)
         return rule_id
     
+    def _register_rule(self, rule: Dict[str, Any], conditions: List[Tuple[Callable, Callable]],
+                       cooldown: Optional[Tuple[float, Tuple[Callable, ...]]] = None):
+        self._compiled[rule['id']] = (rule, conditions)
+        if cooldown is not None:
+            self._cooldowns[rule['id']] = cooldown
+        self.rules.append(rule)
+        self._index_rule(rule)
+        self._register_templates(rule)
+    
+    def remove_rule(self, rule_id: str) -> bool:
+        """Eliminar una regla y sacarla de los índices"""
+        rule = self._rules_by_id.pop(rule_id, None)
+        if rule is None:
+            return False
+            
+        self.rules = [r for r in self.rules if r is not rule]
+        self._rule_order.pop(rule_id, None)
+        self._compiled.pop(rule_id, None)
+        if self._cooldowns.pop(rule_id, None) is not None:
+            self._recent_triggers.discard_prefix(rule_id)
+        
+        bucket = self._rules_by_type.get(rule.get('trigger', {}).get('type'))
+        if bucket:
+            bucket['scan'] = [r for r in bucket['scan'] if r is not rule]
+            for index in bucket['by_condition'].values():
+                for values in index.values():
+                    for key in list(values):
+                        values[key] = [r for r in values[key] if r is not rule]
+                        if not values[key]:
+                            del values[key]
+        return True
+    
+    def _is_equality_condition(self, key: str) -> bool:
+        return not (key.endswith('_min') or key.endswith('_max') or key == 'threshold')
+    
+    def _index_rule(self, rule: Dict[str, Any]):
+        """Registrar la regla bajo su tipo de trigger y, si puede, bajo una condición de igualdad"""
+        self._rules_by_id[rule['id']] = rule
+        self._rule_order[rule['id']] = self._next_order
+        self._next_order += 1
+        
+        trigger = rule.get('trigger', {})
+        bucket = self._rules_by_type.setdefault(trigger.get('type'), {'scan': [], 'by_condition': {}})
+        
+        for key, expected in trigger.get('conditions', {}).items():
+            if not self._is_equality_condition(key):
+                continue
+            # Los strings se comparan sin mayúsculas; los números y booleanos por igualdad
+            if isinstance(expected, str):
+                index = bucket['by_condition'].setdefault(key, {'text': {}, 'value': {}})
+                index['text'].setdefault(expected.lower(), []).append(rule)
+                return
+            if isinstance(expected, (int, float, bool)):
+                index = bucket['by_condition'].setdefault(key, {'text': {}, 'value': {}})
+                index['value'].setdefault(expected, []).append(rule)
+                return
+                
+        # Sin condición indexable: se evalúa contra todo evento de su tipo
+        bucket['scan'].append(rule)
+    
+    def _candidate_rules(self, event_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Reglas que pueden aplicar al evento, en el orden en que se agregaron"""
+        bucket = self._rules_by_type.get(event_data.get('event_type'))
+        if not bucket:
+            return []
+            
+        candidates = list(bucket['scan'])
+        for key, index in bucket['by_condition'].items():
+            actual = self._get_nested_value(event_data, key)
+            candidates.extend(index['text'].get(str(actual).lower(), ()))
+            try:
+                candidates.extend(index['value'].get(actual, ()))
+            except TypeError:
+                # Valor no hasheable: no puede ser igual a un número
+                pass
+                
+        if len(candidates) > 1:
+            candidates.sort(key=lambda rule: self._rule_order[rule['id']])
+        return candidates
+    
     def evaluate_trigger(self, rule: Dict[str, Any], event_data: Dict[str, Any]) -> bool:
         """Evaluar si un trigger debe ejecutarse"""
+        compiled = self._compiled.get(rule.get('id'))
+        if compiled is None or compiled[0] is not rule:
+            # Regla que no pasó por add_rule: se interpreta como antes
+            return self._evaluate_trigger_interpreted(rule, event_data)
+            
+        if rule.get('trigger', {}).get('type') != event_data.get('event_type'):
+            return False
+            
+        for accessor, predicate in compiled[1]:
+            if not predicate(accessor(event_data)):
+                return False
+                
+        return True
+    
+    def _evaluate_trigger_interpreted(self, rule: Dict[str, Any], event_data: Dict[str, Any]) -> bool:
+        """Evaluación interpretada: divide rutas y despacha por sufijo en cada evento"""
         trigger = rule.get('trigger', {})
         trigger_type = trigger.get('type')
         conditions = trigger.get('conditions', {})
@@ -36,6 +430,47 @@ class WorkflowEngine:
                 
         return True
     
+    def compile_conditions(self, conditions: Dict[str, Any]) -> List[Tuple[Callable, Callable]]:
+        """Compilar condiciones a pares (accessor, predicado); valida los valores al agregar la regla"""
+        if not isinstance(conditions, dict):
+            raise ValueError(f'Trigger conditions must be a dict, got {type(conditions).__name__}')
+            
+        compiled = []
+        for key, expected in conditions.items():
+            compiled.append((self._compile_path(key), self._compile_predicate(key, expected)))
+        return compiled
+    
+    def _compile_path(self, path: str) -> Callable[[Any], Any]:
+        """Accessor precompilado equivalente a _get_nested_value"""
+        if not isinstance(path, str) or not path:
+            raise ValueError(f'Invalid condition path: {path!r}')
+        return compile_path(path)
+    
+    def _compile_predicate(self, key: str, expected: Any) -> Callable[[Any], bool]:
+        """Predicado precompilado equivalente a _evaluate_condition"""
+        if key.endswith('_min') or key.endswith('_max') or key == 'threshold':
+            # Cualquier escalar ordenable sirve (números, fechas ISO, etc.), igual que _evaluate_condition
+            if expected is None or isinstance(expected, (dict, list, tuple, set)):
+                raise ValueError(f"Condition '{key}' requires an orderable scalar value, got {expected!r}")
+            compare = {'_min': operator.ge, '_max': operator.le}.get(key[-4:], operator.lt)
+            
+            def ordered(actual):
+                # Un valor ausente o no comparable no cumple la condición
+                try:
+                    return compare(actual, expected)
+                except TypeError:
+                    return False
+            return ordered
+            
+        if isinstance(expected, (dict, list, tuple, set)):
+            raise ValueError(f"Condition '{key}' requires a scalar value, got {expected!r}")
+            
+        if isinstance(expected, str):
+            lowered = expected.lower()
+            return lambda actual: str(actual).lower() == lowered
+            
+        return lambda actual: actual == expected
+    
     def _evaluate_condition(self, key: str, actual: Any, expected: Any) -> bool:
         """Evaluar una condición específica"""
         if key.endswith('_min'):
@@ -64,28 +499,29 @@ class WorkflowEngine:
                 
         return current
     
-    def execute_actions(self, actions: List[Dict[str, Any]], context_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def execute_actions(self, actions: List[Dict[str, Any]], context_data: Dict[str, Any],
+                        timestamp: Optional[str] = None) -> List[Dict[str, Any]]:
         """Ejecutar lista de acciones"""
-        results = []
-        
-        for action in actions:
-            try:
-                result = self._execute_single_action(action, context_data)
-                results.append({
-                    'action_type': action.get('type'),
-                    'success': result.get('success', False),
-                    'message': result.get('message', ''),
-                    'timestamp': datetime.now().isoformat()
-                })
-            except Exception as e:
-                results.append({
-                    'action_type': action.get('type'),
-                    'success': False,
-                    'message': str(e),
-                    'timestamp': datetime.now().isoformat()
-                })
-                
-        return results
+        timestamp = timestamp or datetime.now().isoformat()
+        return [self._run_action(action, context_data, timestamp) for action in actions]
+    
+    def _run_action(self, action: Dict[str, Any], context_data: Dict[str, Any], timestamp: str) -> Dict[str, Any]:
+        """Ejecutar una acción y armar su resultado"""
+        try:
+            result = self._execute_single_action(action, context_data)
+            return {
+                'action_type': action.get('type'),
+                'success': result.get('success', False),
+                'message': result.get('message', ''),
+                'timestamp': timestamp
+            }
+        except Exception as e:
+            return {
+                'action_type': action.get('type'),
+                'success': False,
+                'message': str(e),
+                'timestamp': timestamp
+            }
     
     def _execute_single_action(self, action: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
         """Ejecutar una acción individual"""
@@ -122,6 +558,13 @@ class WorkflowEngine:
         print(f"📦 REORDER: {quantity} units of {material_id} from {supplier_id}")
         return {'success': True, 'message': f'Reorder created for {material_id}'}
     
+    def _reorder_inventory_batch(self, supplier_id: Any, items: Dict[Any, float]) -> Dict[str, Any]:
+        """Simular una reorden combinada de varios materiales a un mismo proveedor"""
+        detail = ', '.join(f"{quantity} units of {material_id}" for material_id, quantity in items.items())
+        
+        print(f"📦 REORDER: {detail} from {supplier_id}")
+        return {'success': True, 'message': f'Combined reorder created for {len(items)} materials from {supplier_id}'}
+    
     def _update_status(self, params: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
         """Simular actualización de estado"""
         new_status = params.get('new_status')
@@ -148,53 +591,672 @@ class WorkflowEngine:
     
     def _replace_variables(self, template: str, context: Dict[str, Any]) -> str:
         """Reemplazar variables en plantillas"""
-        import re
-        
-        def replace_match(match):
-            var_path = match.group(1)
-            value = self._get_nested_value(context, var_path)
-            return str(value) if value is not None else match.group(0)
+        segments = self._templates.get(template)
+        if segments is None:
+            segments = compile_template(template)
+        if len(segments) == 1 and segments[0][1] is None:
+            return segments[0][0]
+            
+        rendered = []
+        for text, accessor in segments:
+            if accessor is None:
+                rendered.append(text)
+            else:
+                value = accessor(context)
+                rendered.append(str(value) if value is not None else text)
+        return ''.join(rendered)
+    
+    def _register_templates(self, rule: Dict[str, Any]):
+        """Precompilar las plantillas de las acciones de la regla"""
+        for action in rule.get('actions', []):
+            for value in action.get('parameters', {}).values():
+                if isinstance(value, str) and '{{' in value:
+                    self._templates[value] = compile_template(value)
+    
+    def compile_cooldown(self, cooldown: Optional[Dict[str, Any]]) -> Optional[Tuple[float, Tuple[Callable, ...]]]:
+        """
+        Compilar la ventana de cooldown de una regla, p. ej. {'minutes': 30, 'key': ['material_id']}:
+        la regla no vuelve a ejecutarse para el mismo valor de la clave dentro de la ventana.
+        Sin 'key' la ventana aplica a la regla completa.
+        """
+        if not cooldown:
+            return None
+            
+        seconds = cooldown.get('seconds', 0) + cooldown.get('minutes', 0) * 60
+        if not isinstance(seconds, (int, float)) or seconds <= 0:
+            raise ValueError(f'Invalid cooldown window: {cooldown}')
+            
+        key = cooldown.get('key', [])
+        if isinstance(key, str):
+            key = [key]
+        return float(seconds), tuple(compile_path(path) for path in key)
+    
+    def _allow_execution(self, rule: Dict[str, Any], event_data: Dict[str, Any]) -> bool:
+        """Aplicar el cooldown de la regla; las ejecuciones suprimidas se cuentan en stats"""
+        cooldown = self._cooldowns.get(rule.get('id'))
+        if cooldown is None:
+            return True
+            
+        seconds, accessors = cooldown
+        key = (rule['id'],) + tuple(self._hashable(accessor(event_data)) for accessor in accessors)
+        if self._recent_triggers.add_if_absent(key, seconds):
+            return True
+            
+        self.stats['suppressed'] += 1
+        by_rule = self.stats['suppressed_by_rule']
+        by_rule[rule['id']] = by_rule.get(rule['id'], 0) + 1
+        return False
+    
+    @staticmethod
+    def _hashable(value: Any) -> Any:
+        try:
+            hash(value)
+            return value
+        except TypeError:
+            return json.dumps(value, sort_keys=True, default=str)
+    
+    def _matching_rules(self, event_data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Reglas habilitadas cuyo trigger coincide con el evento y que no están en cooldown"""
+        for rule in self._candidate_rules(event_data):
+            if (rule.get('enabled', True) and self.evaluate_trigger(rule, event_data)
+                    and self._allow_execution(rule, event_data)):
+                yield rule
+    
+    def _record_execution(self, rule: Dict[str, Any], event_data: Dict[str, Any],
+                          action_results: List[Dict[str, Any]], timestamp: str):
+        """Actualizar contador y guardar en historial"""
+        rule['execution_count'] = rule.get('execution_count', 0) + 1
+        rule['last_executed'] = timestamp
+        self.stats['executed'] += 1
         
-        return re.sub(r'\{\{([^}]+)\}\}', replace_match, template)
+        self.execution_history.append(rule.get('id'), event_data, action_results, timestamp)
     
     def process_event(self, event_data: Dict[str, Any]) -> Dict[str, Any]:
         """Procesar un evento y ejecutar reglas aplicables"""
         executed_rules = []
+        timestamp = datetime.now().isoformat()
         
-        for rule in self.rules:
-            if not rule.get('enabled', True):
-                continue
+        for rule in self._matching_rules(event_data):
+            print(f"🎯 Executing rule: {rule.get('name', rule.get('id'))}")
+            
+            # Ejecutar acciones
+            action_results = self.execute_actions(rule.get('actions', []), event_data, timestamp)
+            self._record_execution(rule, event_data, action_results, timestamp)
+            
+            executed_rules.append({
+                'rule_id': rule.get('id'),
+                'rule_name': rule.get('name'),
+                'action_results': action_results,
+                'success': all(result.get('success', False) for result in action_results)
+            })
+        
+        return {
+            'success': True,
+            'executed_rules': executed_rules,
+            'total_executed': len(executed_rules)
+        }
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Contadores del motor: ejecuciones, ejecuciones suprimidas por cooldown y claves activas"""
+        return {
+            'executed': self.stats['executed'],
+            'suppressed': self.stats['suppressed'],
+            'suppressed_by_rule': dict(self.stats['suppressed_by_rule']),
+            'active_cooldown_keys': len(self._recent_triggers)
+        }
+    
+    def close(self):
+        """Volcar el historial de ejecuciones a disco (si tiene spill_path) y cerrar su log"""
+        self.execution_history.close()
+    
+    def process_events(self, events: Iterable[Dict[str, Any]], batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """
+        Procesar un flujo de eventos en lotes. Devuelve un resultado por evento (mismo formato
+        que process_event), usa un solo timestamp por lote y combina las reordenes de inventario
+        del lote en una por proveedor. Varios eventos que piden el mismo material al mismo
+        proveedor generan una sola línea (la mayor cantidad pedida), no la suma.
+        """
+        batch = []
+        for event_data in events:
+            batch.append(event_data)
+            if len(batch) >= batch_size:
+                yield from self._process_batch(batch)
+                batch = []
                 
-            if self.evaluate_trigger(rule, event_data):
+        if batch:
+            yield from self._process_batch(batch)
+    
+    def _process_batch(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Procesar un lote de eventos; las acciones agregables se ejecutan al final del lote"""
+        timestamp = datetime.now().isoformat()
+        batch_results = []
+        executions = []  # (regla, evento, resultados): se registran cuando ya están completos
+        reorders = {}  # supplier_id -> {'items': {material_id: cantidad}, 'results': [...]}
+        
+        for event_data in events:
+            executed_rules = []
+            
+            for rule in self._matching_rules(event_data):
                 print(f"🎯 Executing rule: {rule.get('name', rule.get('id'))}")
+                action_results = []
                 
-                # Ejecutar acciones
-                action_results = self.execute_actions(rule.get('actions', []), event_data)
-                
-                # Actualizar contador
-                rule['execution_count'] = rule.get('execution_count', 0) + 1
-                rule['last_executed'] = datetime.now().isoformat()
-                
+                for action in rule.get('actions', []):
+                    if action.get('type') != 'reorder_inventory':
+                        action_results.append(self._run_action(action, event_data, timestamp))
+                        continue
+                        
+                    # Se difiere: se completa con el resultado de la reorden combinada
+                    params = action.get('parameters', {})
+                    result = {'action_type': 'reorder_inventory', 'success': False, 'message': '', 'timestamp': timestamp}
+                    group = reorders.setdefault(params.get('supplier_id'), {'items': {}, 'results': []})
+                    material_id = params.get('material_id')
+                    group['items'][material_id] = max(group['items'].get(material_id, 0), params.get('quantity') or 0)
+                    group['results'].append(result)
+                    action_results.append(result)
+                    
+                executions.append((rule, event_data, action_results))
                 executed_rules.append({
                     'rule_id': rule.get('id'),
                     'rule_name': rule.get('name'),
-                    'action_results': action_results,
-                    'success': all(result.get('success', False) for result in action_results)
+                    'action_results': action_results
                 })
                 
-                # Guardar en historial
-                self.execution_history.append({
-                    'rule_id': rule.get('id'),
-                    'event_data': event_data,
-                    'action_results': action_results,
-                    'timestamp': datetime.now().isoformat()
-                })
+            batch_results.append(executed_rules)
+        
+        for supplier_id, group in reorders.items():
+            try:
+                result = self._reorder_inventory_batch(supplier_id, group['items'])
+            except Exception as e:
+                result = {'success': False, 'message': str(e)}
+            for action_result in group['results']:
+                action_result['success'] = result.get('success', False)
+                action_result['message'] = result.get('message', '')
+                
+        for rule, event_data, action_results in executions:
+            self._record_execution(rule, event_data, action_results, timestamp)
+        
+        results = []
+        for executed_rules in batch_results:
+            for executed in executed_rules:
+                executed['success'] = all(result.get('success', False) for result in executed['action_results'])
+            results.append({
+                'success': True,
+                'executed_rules': executed_rules,
+                'total_executed': len(executed_rules)
+            })
+        return results
+
+class FakeActionSink:
+    """Destino local de WhatsApp y notificaciones con latencia configurable (para pruebas y benchmarks)"""
+    
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.sent = []
         
+    async def send_whatsapp(self, params: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        await asyncio.sleep(self.latency)
+        self.sent.append(('send_whatsapp', params))
+        return {'success': True, 'message': 'WhatsApp sent'}
+    
+    async def send_notification(self, params: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        await asyncio.sleep(self.latency)
+        self.sent.append(('send_notification', params))
+        return {'success': True, 'message': 'Notification sent'}
+    
+    def send_whatsapp_sync(self, params: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        time.sleep(self.latency)
+        self.sent.append(('send_whatsapp', params))
+        return {'success': True, 'message': 'WhatsApp sent'}
+    
+    def send_notification_sync(self, params: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        time.sleep(self.latency)
+        self.sent.append(('send_notification', params))
+        return {'success': True, 'message': 'Notification sent'}
+    
+    def handlers(self) -> Dict[str, Callable]:
+        return {'send_whatsapp': self.send_whatsapp, 'send_notification': self.send_notification}
+
+class _ActionStarted(Exception):
+    """Timeout de un handler sincrónico que ya había empezado a correr"""
+
+class AsyncWorkflowEngine(WorkflowEngine):
+    """
+    Variante asyncio del motor: las acciones de una regla, y las reglas que coinciden con un
+    evento, se ejecutan concurrentemente. Cada tipo de acción tiene un límite de concurrencia,
+    un timeout por intento y reintentos con backoff exponencial. Los resultados tienen el
+    mismo formato que process_event.
+    
+    Los handlers sincrónicos corren en un pool de hilos propio de cada tipo (del tamaño de su
+    límite). Un hilo no se puede cancelar: al vencer el timeout se devuelve el error sin
+    esperarlo, y solo se reintenta si la acción todavía no había empezado.
+    """
+    
+    DEFAULT_CONCURRENCY = {
+        'send_whatsapp': 10,
+        'send_notification': 20,
+        'reorder_inventory': 5,
+        'update_status': 20,
+        'create_task': 20
+    }
+    
+    def __init__(self, handlers: Optional[Dict[str, Callable]] = None, concurrency: Optional[Dict[str, int]] = None,
+                 timeout: float = 10.0, retries: int = 2, backoff: float = 0.5,
+                 history_size: int = 1000, history_path: Optional[str] = None):
+        super().__init__(history_size, history_path)
+        # Handlers async por tipo: async def handler(params, context) -> {'success', 'message'}
+        self.async_handlers = dict(handlers or {})
+        self.concurrency = {**self.DEFAULT_CONCURRENCY, **(concurrency or {})}
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._semaphores = {}
+        self._semaphore_loop = None
+        self._executors = {}
+        
+    def _executor(self, action_type: str) -> ThreadPoolExecutor:
+        executor = self._executors.get(action_type)
+        if executor is None:
+            executor = self._executors[action_type] = ThreadPoolExecutor(
+                max_workers=self.concurrency.get(action_type, 10), thread_name_prefix=f'action-{action_type}'
+            )
+        return executor
+    
+    def close(self):
+        super().close()
+        for executor in self._executors.values():
+            executor.shutdown(wait=False)
+        self._executors = {}
+        
+    def _semaphore(self, action_type: str) -> asyncio.Semaphore:
+        # Los semáforos quedan ligados a un event loop: se recrean si cambia el loop
+        loop = asyncio.get_running_loop()
+        if loop is not self._semaphore_loop:
+            self._semaphores = {}
+            self._semaphore_loop = loop
+            
+        semaphore = self._semaphores.get(action_type)
+        if semaphore is None:
+            semaphore = self._semaphores[action_type] = asyncio.Semaphore(self.concurrency.get(action_type, 10))
+        return semaphore
+    
+    def _render_parameters(self, parameters: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        """Reemplazar las variables {{...}} de los parámetros de una acción"""
+        return {
+            key: self._replace_variables(value, context) if isinstance(value, str) and '{{' in value else value
+            for key, value in parameters.items()
+        }
+    
+    async def _call_handler(self, handler: Optional[Callable], action: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        if handler is not None:
+            params = self._render_parameters(action.get('parameters', {}), context)
+            async with self._semaphore(action.get('type')):
+                return await asyncio.wait_for(handler(params, context), self.timeout)
+            
+        # Los handlers sincrónicos reemplazan sus variables ellos mismos
+        future = self._executor(action.get('type')).submit(self._execute_single_action, action, context)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            if future.cancel():
+                raise
+            # Ya estaba corriendo: puede completar la acción igual, reintentarla la duplicaría
+            raise _ActionStarted() from None
+    
+    async def _run_action_async(self, action: Dict[str, Any], context: Dict[str, Any], timestamp: str) -> Dict[str, Any]:
+        """Ejecutar una acción con límite de concurrencia, timeout y reintentos"""
+        handler = self.async_handlers.get(action.get('type'))
+        message = ''
+        
+        for attempt in range(self.retries + 1):
+            try:
+                result = await self._call_handler(handler, action, context)
+                return {
+                    'action_type': action.get('type'),
+                    'success': result.get('success', False),
+                    'message': result.get('message', ''),
+                    'timestamp': timestamp
+                }
+            except _ActionStarted:
+                message = f'Timed out after {self.timeout}s'
+                break
+            except asyncio.TimeoutError:
+                message = f'Timed out after {self.timeout}s'
+            except Exception as e:
+                message = str(e)
+                
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+        
+        return {
+            'action_type': action.get('type'),
+            'success': False,
+            'message': message,
+            'timestamp': timestamp
+        }
+    
+    async def execute_actions_async(self, actions: List[Dict[str, Any]], context_data: Dict[str, Any],
+                                    timestamp: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Ejecutar las acciones de una regla concurrentemente (resultados en el orden original)"""
+        timestamp = timestamp or datetime.now().isoformat()
+        return list(await asyncio.gather(*(self._run_action_async(action, context_data, timestamp) for action in actions)))
+    
+    async def process_event_async(self, event_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Procesar un evento ejecutando todas las reglas coincidentes en paralelo"""
+        timestamp = datetime.now().isoformat()
+        rules = list(self._matching_rules(event_data))
+        for rule in rules:
+            print(f"🎯 Executing rule: {rule.get('name', rule.get('id'))}")
+            
+        all_results = await asyncio.gather(
+            *(self.execute_actions_async(rule.get('actions', []), event_data, timestamp) for rule in rules)
+        )
+        
+        executed_rules = []
+        for rule, action_results in zip(rules, all_results):
+            self._record_execution(rule, event_data, action_results, timestamp)
+            executed_rules.append({
+                'rule_id': rule.get('id'),
+                'rule_name': rule.get('name'),
+                'action_results': action_results,
+                'success': all(result.get('success', False) for result in action_results)
+            })
+            
         return {
             'success': True,
             'executed_rules': executed_rules,
             'total_executed': len(executed_rules)
         }
+    
+    async def process_events_async(self, events: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Procesar varios eventos independientes concurrentemente"""
+        return list(await asyncio.gather(*(self.process_event_async(event_data) for event_data in events)))
+
+class EventQueue:
+    """
+    Cola de eventos durable sobre SQLite con entrega at-least-once. Los eventos que traen
+    'idempotency_key' se deduplican por esa clave mientras su fila exista (los procesados se
+    podan tras retention_seconds); los demás se encolan siempre. Los lotes se toman con un
+    lease: si el worker muere, el lease vence y el lote se vuelve a entregar.
+    """
+    
+    def __init__(self, path: str, lease_seconds: float = 60.0, max_attempts: int = 5,
+                 retention_seconds: float = 7 * 86400):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS events ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, idempotency_key TEXT NOT NULL UNIQUE, payload TEXT NOT NULL, '
+            "status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+            'enqueued_at REAL NOT NULL, leased_until REAL, processed_at REAL, last_error TEXT)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_events_status ON events(status, id)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS rule_stats ('
+            'rule_id TEXT PRIMARY KEY, execution_count INTEGER NOT NULL DEFAULT 0, last_executed TEXT)'
+        )
+        
+    @staticmethod
+    def idempotency_key(event_data: Dict[str, Any]) -> str:
+        """Clave explícita del evento; sin ella, una clave única (dos eventos iguales son dos eventos)"""
+        if event_data.get('idempotency_key'):
+            return str(event_data['idempotency_key'])
+        return uuid.uuid4().hex
+    
+    def enqueue(self, events: Iterable[Dict[str, Any]]) -> int:
+        """Encolar eventos en una transacción; devuelve cuántos eran nuevos"""
+        now = time.time()
+        rows = [(self.idempotency_key(event), json.dumps(event, default=str), now) for event in events]
+        with self._transaction():
+            before = self.conn.total_changes
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO events (idempotency_key, payload, enqueued_at) VALUES (?, ?, ?)', rows
+            )
+            return self.conn.total_changes - before
+    
+    def lease(self, batch_size: int = 100) -> List[Tuple[int, Dict[str, Any]]]:
+        """Tomar un lote de eventos pendientes (o con lease vencido)"""
+        now = time.time()
+        with self._transaction():
+            rows = self.conn.execute(
+                "SELECT id, payload FROM events WHERE status = 'pending' "
+                "OR (status = 'leased' AND leased_until < ?) ORDER BY id LIMIT ?",
+                (now, batch_size)
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE events SET status = 'leased', leased_until = ?, attempts = attempts + 1 WHERE id = ?",
+                [(now + self.lease_seconds, event_id) for event_id, _ in rows]
+            )
+        return [(event_id, json.loads(payload)) for event_id, payload in rows]
+    
+    def ack(self, event_ids: List[int], rule_updates: Dict[str, Tuple[int, str]]):
+        """Marcar el lote como procesado y actualizar contadores de reglas, todo en una transacción"""
+        now = time.time()
+        with self._transaction():
+            self.conn.executemany(
+                "UPDATE events SET status = 'done', processed_at = ?, leased_until = NULL WHERE id = ?",
+                [(now, event_id) for event_id in event_ids]
+            )
+            self.conn.executemany(
+                'INSERT INTO rule_stats (rule_id, execution_count, last_executed) VALUES (?, ?, ?) '
+                'ON CONFLICT(rule_id) DO UPDATE SET execution_count = execution_count + excluded.execution_count, '
+                'last_executed = MAX(COALESCE(last_executed, \'\'), excluded.last_executed)',
+                [(rule_id, count, last_executed) for rule_id, (count, last_executed) in rule_updates.items()]
+            )
+    
+    def fail(self, event_ids: List[int], error: str):
+        """Devolver el lote a la cola; tras max_attempts los eventos quedan como 'failed'"""
+        with self._transaction():
+            self.conn.executemany(
+                "UPDATE events SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                'leased_until = NULL, last_error = ? WHERE id = ?',
+                [(self.max_attempts, error, event_id) for event_id in event_ids]
+            )
+    
+    def rule_stats(self) -> Dict[str, Dict[str, Any]]:
+        rows = self.conn.execute('SELECT rule_id, execution_count, last_executed FROM rule_stats')
+        return {rule_id: {'execution_count': count, 'last_executed': last} for rule_id, count, last in rows}
+    
+    def take_rule_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Exportar y vaciar los contadores acumulados: execution_count son ejecuciones nuevas (a
+        sumar en el almacén de reglas) y last_executed la última. Cada ejecución se exporta una vez.
+        """
+        with self._transaction():
+            stats = self.rule_stats()
+            self.conn.execute('DELETE FROM rule_stats')
+        return stats
+    
+    def counts(self) -> Dict[str, int]:
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM events GROUP BY status').fetchall())
+    
+    def has_pending(self) -> bool:
+        return bool(self.conn.execute("SELECT EXISTS(SELECT 1 FROM events WHERE status = 'pending')").fetchone()[0])
+    
+    def prune(self) -> int:
+        """Borrar los eventos procesados hace más de retention_seconds; devuelve cuántos"""
+        cutoff = time.time() - self.retention_seconds
+        with self._transaction():
+            return self.conn.execute(
+                "DELETE FROM events WHERE status = 'done' AND processed_at < ?", (cutoff,)
+            ).rowcount
+    
+    @contextlib.contextmanager
+    def _transaction(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        else:
+            self.conn.execute('COMMIT')
+    
+    def close(self):
+        self.conn.close()
+
+def apply_rule_stats(rules: List[Dict[str, Any]], stats: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Sumar a las reglas los contadores exportados por EventQueue.take_rule_stats"""
+    for rule in rules:
+        delta = stats.get(str(rule.get('id')))
+        if delta is None:
+            continue
+        rule['execution_count'] = rule.get('execution_count', 0) + delta['execution_count']
+        rule['last_executed'] = max(rule.get('last_executed') or '', delta['last_executed'] or '') or None
+    return rules
+
+def sync_rules_file(event_queue: EventQueue, path: str) -> Dict[str, Dict[str, Any]]:
+    """Escribir en el archivo de reglas los contadores acumulados en la cola (una escritura)"""
+    stats = event_queue.take_rule_stats()
+    if stats:
+        with open(path) as f:
+            rules = apply_rule_stats(json.load(f), stats)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(rules, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    return stats
+
+def run_worker(engine: WorkflowEngine, event_queue: EventQueue, batch_size: int = 100,
+               poll_interval: float = 1.0, max_batches: Optional[int] = None,
+               should_stop: Optional[Callable[[], bool]] = None,
+               on_idle: Optional[Callable[[], Any]] = None) -> Dict[str, int]:
+    """
+    Loop del worker: toma lotes de la cola, los procesa con process_events y confirma cada lote
+    junto con los execution_count/last_executed acumulados de sus reglas (una escritura por lote).
+    Cuando la cola está vacía llama a on_idle (p. ej. sync_rules_file) y poda los eventos
+    procesados viejos (a lo sumo una vez por minuto).
+    """
+    stats = {'batches': 0, 'events': 0, 'executions': 0, 'failed_batches': 0}
+    last_prune = 0.0
+    
+    while not (should_stop and should_stop()):
+        if max_batches is not None and stats['batches'] + stats['failed_batches'] >= max_batches:
+            break
+            
+        leased = event_queue.lease(batch_size)
+        if not leased:
+            if on_idle is not None:
+                on_idle()
+            if time.time() - last_prune >= 60:
+                event_queue.prune()
+                last_prune = time.time()
+            if max_batches is not None:
+                break
+            time.sleep(poll_interval)
+            continue
+            
+        event_ids = [event_id for event_id, _ in leased]
+        try:
+            results = list(engine.process_events((event for _, event in leased), batch_size=len(leased)))
+        except Exception as e:
+            event_queue.fail(event_ids, str(e))
+            stats['failed_batches'] += 1
+            continue
+            
+        rule_updates = {}
+        for result in results:
+            for executed in result['executed_rules']:
+                rule_id = executed['rule_id']
+                count, _ = rule_updates.get(rule_id, (0, None))
+                rule_updates[rule_id] = (count + 1, engine._rules_by_id[rule_id].get('last_executed'))
+                
+        event_queue.ack(event_ids, rule_updates)
+        stats['batches'] += 1
+        stats['events'] += len(leased)
+        stats['executions'] += sum(count for count, _ in rule_updates.values())
+        
+    return stats
+
+def benchmark_conditions(iterations: int = 100000) -> Dict[str, float]:
+    """Microbenchmark: costo por evento de las condiciones compiladas vs. la ruta interpretada"""
+    engine = WorkflowEngine()
+    rule = {
+        'name': 'Benchmark',
+        'trigger': {
+            'type': 'inventory_low',
+            'conditions': {
+                'material_id': 'flour_001',
+                'current_stock': 5,
+                'details.warehouse': 'central',
+                'quantity_min': 1,
+                'quantity_max': 100,
+                'threshold': 10
+            }
+        },
+        'actions': []
+    }
+    engine.add_rule(rule)
+    event = {
+        'event_type': 'inventory_low',
+        'material_id': 'FLOUR_001',
+        'current_stock': 5,
+        'details': {'warehouse': 'Central'},
+        'quantity_min': 20,
+        'quantity_max': 20,
+        'threshold': 3
+    }
+    
+    start = time.perf_counter()
+    for _ in range(iterations):
+        engine._evaluate_trigger_interpreted(rule, event)
+    interpreted = (time.perf_counter() - start) / iterations * 1e6
+    
+    start = time.perf_counter()
+    for _ in range(iterations):
+        engine.evaluate_trigger(rule, event)
+    compiled = (time.perf_counter() - start) / iterations * 1e6
+    
+    return {
+        'interpreted_us_per_event': round(interpreted, 3),
+        'compiled_us_per_event': round(compiled, 3),
+        'speedup': round(interpreted / compiled, 2)
+    }
+
+def benchmark_async(n_events: int = 50, latency: float = 0.05) -> Dict[str, float]:
+    """Benchmark: motor secuencial vs. asyncio contra un destino falso con latencia"""
+    rule = {
+        'name': 'Confirmación de pedido',
+        'trigger': {'type': 'order_created', 'conditions': {}},
+        'actions': [
+            {'type': 'send_whatsapp', 'parameters': {'customer_phone': '{{phone}}', 'template': 'Pedido {{order_id}} recibido'}},
+            {'type': 'send_notification', 'parameters': {'title': 'Nuevo pedido', 'message': '{{order_id}}'}}
+        ]
+    }
+    events = [{'event_type': 'order_created', 'order_id': i, 'phone': f'+54 9 11 0000-{i:04d}'} for i in range(n_events)]
+    
+    sync_sink = FakeActionSink(latency)
+    sync_engine = WorkflowEngine()
+    sync_engine._send_whatsapp = sync_sink.send_whatsapp_sync
+    sync_engine._send_notification = sync_sink.send_notification_sync
+    sync_engine.add_rule(json.loads(json.dumps(rule)))
+    
+    async_sink = FakeActionSink(latency)
+    async_engine = AsyncWorkflowEngine(handlers=async_sink.handlers())
+    async_engine.add_rule(json.loads(json.dumps(rule)))
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for event in events:
+            sync_engine.process_event(event)
+        sequential = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        asyncio.run(async_engine.process_events_async(events))
+        concurrent = time.perf_counter() - start
+    async_engine.close()
+    
+    return {
+        'events': n_events,
+        'latency_s': latency,
+        'sequential_s': round(sequential, 3),
+        'async_s': round(concurrent, 3),
+        'speedup': round(sequential / concurrent, 2)
+    }
 
 def main():
     """Función de prueba"""
@@ -204,11 +1266,11 @@ def main():
     rule = {
         'name': 'Reorden Automático de Harina',
         'description': 'Reordena harina cuando el stock esté bajo',
+        'cooldown': {'minutes': 30, 'key': ['material_id']},
         'trigger': {
             'type': 'inventory_low',
             'conditions': {
                 'material_id': 'flour_001',
-                'current_stock': 5,
                 'threshold': 10
             }
         },
@@ -240,11 +1302,73 @@ def main():
         'material_id': 'flour_001',
         'material_name': 'Harina de Trigo',
         'current_stock': 5,
+        'threshold': 5,  # Nivel de stock que se compara contra el umbral de la regla
         'timestamp': datetime.now().isoformat()
     }
     
     result = engine.process_event(event)
     print(f"\n📊 Execution Result: {json.dumps(result, indent=2)}")
+    engine.close()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Motor de automatización')
+    parser.add_argument('--benchmark', action='store_true', help='Microbenchmark de evaluación de condiciones')
+    parser.add_argument('--iterations', type=int, default=100000)
+    parser.add_argument('--benchmark-async', action='store_true', help='Benchmark del motor asyncio con un destino falso')
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--worker', action='store_true', help='Procesar eventos de la cola durable')
+    parser.add_argument('--enqueue', help="Archivo JSON-lines con eventos a encolar ('-' para stdin)")
+    parser.add_argument('--queue', default='tmp/workflow_queue.db', help='Base SQLite de la cola de eventos')
+    parser.add_argument('--rules', help='Archivo JSON con la lista de reglas (con sus ids); el worker le escribe los contadores')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--once', action='store_true', help='Vaciar la cola y salir')
+    args = parser.parse_args()
+    
+    if args.enqueue or args.worker:
+        os.makedirs(os.path.dirname(args.queue) or '.', exist_ok=True)
+        event_queue = EventQueue(args.queue)
+        
+        if args.enqueue:
+            with (contextlib.nullcontext(sys.stdin) if args.enqueue == '-' else open(args.enqueue)) as f:
+                added = event_queue.enqueue(json.loads(line) for line in f if line.strip())
+            print(json.dumps({'enqueued': added, 'queue': event_queue.counts()}))
+            
+        if not args.worker:
+            event_queue.close()
+        else:
+            engine = WorkflowEngine()
+            if args.rules:
+                with open(args.rules) as f:
+                    for rule in json.load(f):
+                        engine.load_rule(rule)
+                        
+            # Contadores escritos en el archivo de reglas (se informan al terminar)
+            synced = {}
+            
+            def sync_rules():
+                for rule_id, delta in sync_rules_file(event_queue, args.rules).items():
+                    apply_rule_stats([synced.setdefault(rule_id, {'id': rule_id})], {rule_id: delta})
+                    
+            # SIGTERM termina el lote en curso y sale
+            stopping = []
+            signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+            try:
+                stats = run_worker(engine, event_queue, args.batch_size, args.poll_interval, max_batches=None,
+                                   should_stop=lambda: bool(stopping) or (args.once and not event_queue.has_pending()),
+                                   on_idle=sync_rules if args.rules else None)
+                if args.rules:
+                    sync_rules()
+            finally:
+                engine.close()
+                event_queue.close()
+            stats['rule_stats'] = {rule_id: {'execution_count': delta['execution_count'], 'last_executed': delta['last_executed']}
+                                   for rule_id, delta in synced.items()}
+            print(json.dumps(stats))
+    elif args.benchmark_async:
+        print(json.dumps(benchmark_async(args.events, args.latency), indent=2))
+    elif args.benchmark:
+        print(json.dumps(benchmark_conditions(args.iterations), indent=2))
+    else:
+        main()